@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+"""Measure the memory used by the IR for SPIR-V binaries.
+
+The memory is measured with tracemalloc after reading each module and
+discarding its source binary, so it only includes the IR objects.
+
+The script can be run on older versions of spirv_tools too (by setting
+PYTHONPATH), which is used for comparing the memory use before and after
+a change. For the 216k-instruction module used when changing the IR
+objects to use __slots__ and compact use sets, the results were:
+  before: 138.8 MB, 642 bytes/instruction
+  after:   77.4 MB, 358 bytes/instruction"""
+import argparse
+import gc
+import io
+import tracemalloc
+
+from spirv_tools import read_spirv
+
+
+def measure(path):
+    """Return (bytes used, number of instructions) for the module in path."""
+    with open(path, 'rb') as stream:
+        data = stream.read()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        start, _ = tracemalloc.get_traced_memory()
+        module = read_spirv.read_module(io.BytesIO(data))
+        # Older versions do not keep the source binary.
+        if hasattr(module, 'discard_source_binary'):
+            module.discard_source_binary()
+        gc.collect()
+        end, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    nof_insts = sum(1 for _ in module.instructions())
+    return end - start, nof_insts
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('filenames', help='SPIR-V binaries', nargs='+',
+                        metavar='filename')
+    args = parser.parse_args()
+    for path in args.filenames:
+        nof_bytes, nof_insts = measure(path)
+        print('%s: %d instructions, %.1f MB, %d bytes/instruction' % (
+            path, nof_insts, nof_bytes / 1e6, nof_bytes // max(nof_insts, 1)))
+
+
+if __name__ == '__main__':
+    main()
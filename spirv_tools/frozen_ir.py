@@ -0,0 +1,524 @@
+"""Read-only representation of a module, stored in arrays.
+
+A FrozenModule keeps the SPIR-V binary together with a few arrays
+describing the instructions (opcode, position in the binary, type ID,
+and result ID for each instruction), instead of creating objects for
+each instruction and ID as ir.Module does. This makes it much cheaper
+to create and to keep in memory, which is useful when analyzing large
+numbers of modules that are not modified.
+
+The FrozenModule provides the same iteration API as ir.Module
+(instructions(), functions, basic_blocks, etc.), where the instructions,
+IDs, basic blocks, and functions are lightweight views that are created
+when they are accessed. Bulk queries, such as opcode_histogram() and
+users(), work directly on the arrays."""
+import array
+import bisect
+import collections
+import sys
+
+from spirv_tools import ir
+from spirv_tools import read_spirv
+from spirv_tools import spirv
+from spirv_tools import write_spirv
+
+
+_OPFUNCTION = spirv.spv['Op']['OpFunction']
+_OPFUNCTIONEND = spirv.spv['Op']['OpFunctionEnd']
+_OPFUNCTIONPARAMETER = spirv.spv['Op']['OpFunctionParameter']
+_OPLABEL = spirv.spv['Op']['OpLabel']
+
+
+class _FrozenIds(dict):
+    """Mapping from ID value to FrozenId, creating the FrozenId if needed.
+
+    This is used as value_to_id when the read_spirv operand decoders
+    decode the operands of a FrozenInstruction."""
+    def __init__(self, module):
+        dict.__init__(self)
+        self.module = module
+
+    def get(self, value, default=None):
+        id_obj = dict.get(self, value)
+        if id_obj is None:
+            id_obj = FrozenId(self.module, value)
+            self[value] = id_obj
+        return id_obj
+
+
+class FrozenId(object):
+    """Read-only view of an ID in a FrozenModule."""
+    __slots__ = ['module', 'value']
+    is_temp = False
+
+    def __init__(self, module, value):
+        self.module = module
+        self.value = value
+
+    @property
+    def inst(self):
+        """The instruction defining this ID, or None."""
+        return self.module.get_inst_by_id(self.value)
+
+    @property
+    def uses(self):
+        """The set of instructions using this ID."""
+        return frozenset(self.module.users(self.value))
+
+    def __str__(self):
+        return '%' + str(self.value)
+
+    def __hash__(self):
+        return hash(self.value)
+
+    def __eq__(self, other):
+        return (isinstance(other, FrozenId) and other.value == self.value and
+                other.module is self.module)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+
+class FrozenInstruction(object):
+    """Read-only view of the instruction number idx in a FrozenModule."""
+    __slots__ = ['module', 'idx']
+
+    def __init__(self, module, idx):
+        self.module = module
+        self.idx = idx
+
+    def __str__(self):
+        res = ''
+        if self.result_id is not None:
+            res = res + str(self.result_id) + ' = '
+        res = res + self.op_name
+        if self.type_id is not None:
+            res = res + ' ' + str(self.type_id)
+        operands = self.operands
+        if operands:
+            res = res + ' ' + ', '.join(str(operand) for operand in operands)
+        return res
+
+    def __hash__(self):
+        return self.idx
+
+    def __eq__(self, other):
+        return (isinstance(other, FrozenInstruction) and
+                other.idx == self.idx and other.module is self.module)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    @property
+    def opcode(self):
+        """The numerical opcode of the instruction."""
+        return self.module.opcodes[self.idx]
+
+    @property
+    def op_name(self):
+        """The operation name of the instruction."""
+        return ir.OPCODE_TO_OPNAME[self.module.opcodes[self.idx]]
+
+    @property
+    def result_id(self):
+        """The instruction's result ID, or None."""
+        value = self.module.result_ids[self.idx]
+        return self.module.value_to_id.get(value) if value else None
+
+    @property
+    def type_id(self):
+        """The instruction's type ID, or None."""
+        value = self.module.type_ids[self.idx]
+        return self.module.value_to_id.get(value) if value else None
+
+    @property
+    def words(self):
+        """The words of the instruction."""
+        start = self.module.offsets[self.idx]
+        end = self.module.offsets[self.idx + 1]
+        return self.module.words[start:end]
+
+    @property
+    def operands(self):
+        """The instruction's operands, in the same format as ir.Instruction.
+
+        The operands are decoded each time this is accessed."""
+        module = self.module
+        words = module.words
+        idx = module.offsets[self.idx]
+        end = module.offsets[self.idx + 1]
+        _, has_type, has_result, nof_ids, operand_decoders = (
+            read_spirv._INST_DECODERS[words[idx] & 0xFFFF])
+        idx += 1 + has_type + has_result
+        value_to_id = module.value_to_id
+        operands = [value_to_id.get(word) for word in words[idx:idx + nof_ids]]
+        idx += nof_ids
+        for decode in operand_decoders:
+            idx = decode(module, words, idx, end, operands)
+        return operands
+
+    @property
+    def function(self):
+        """The function containing the instruction, or None."""
+        return self.module._get_function(self.idx)
+
+    @property
+    def basic_block(self):
+        """The basic block containing the instruction, or None."""
+        return self.module._get_basic_block(self.idx)
+
+    def uses(self):
+        """Return all instructions using this instruction.
+
+        Debug and decoration instructions are not considered using
+        any instruction."""
+        value = self.module.result_ids[self.idx]
+        if not value:
+            return []
+        return [inst for inst in self.module.users(value)
+                if (inst.op_name not in ir.DECORATION_INSTRUCTIONS and
+                    inst.op_name not in ir.DEBUG_INSTRUCTIONS)]
+
+
+class FrozenBasicBlock(object):
+    """Read-only view of a basic block in a FrozenModule.
+
+    The basic block consists of the OpLabel instruction number label_idx
+    and the following instructions up to (but not including) end_idx."""
+    __slots__ = ['module', 'label_idx', 'end_idx']
+
+    def __init__(self, module, label_idx, end_idx):
+        self.module = module
+        self.label_idx = label_idx
+        self.end_idx = end_idx
+
+    def __str__(self):
+        return str(self.inst)
+
+    def __hash__(self):
+        return self.label_idx
+
+    def __eq__(self, other):
+        return (isinstance(other, FrozenBasicBlock) and
+                other.label_idx == self.label_idx and
+                other.module is self.module)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    @property
+    def inst(self):
+        """The OpLabel instruction of the basic block."""
+        return FrozenInstruction(self.module, self.label_idx)
+
+    @property
+    def insts(self):
+        """The instructions in the basic block (not including OpLabel)."""
+        return [FrozenInstruction(self.module, idx)
+                for idx in range(self.label_idx + 1, self.end_idx)]
+
+    @property
+    def function(self):
+        """The function containing the basic block."""
+        return self.module._get_function(self.label_idx)
+
+    def instructions(self):
+        """Iterate over the instructions in the basic block."""
+        for idx in range(self.label_idx + 1, self.end_idx):
+            yield FrozenInstruction(self.module, idx)
+
+
+class FrozenFunction(object):
+    """Read-only view of a function in a FrozenModule.
+
+    The function consists of the instructions from the OpFunction
+    instruction number start_idx up to the OpFunctionEnd instruction
+    number end_idx."""
+    __slots__ = ['module', 'start_idx', 'end_idx']
+
+    def __init__(self, module, start_idx, end_idx):
+        self.module = module
+        self.start_idx = start_idx
+        self.end_idx = end_idx
+
+    def __str__(self):
+        return str(self.inst)
+
+    def __hash__(self):
+        return self.start_idx
+
+    def __eq__(self, other):
+        return (isinstance(other, FrozenFunction) and
+                other.start_idx == self.start_idx and
+                other.module is self.module)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    @property
+    def inst(self):
+        """The OpFunction instruction."""
+        return FrozenInstruction(self.module, self.start_idx)
+
+    @property
+    def end_inst(self):
+        """The OpFunctionEnd instruction."""
+        return FrozenInstruction(self.module, self.end_idx)
+
+    @property
+    def parameters(self):
+        """The OpFunctionParameter instructions."""
+        opcodes = self.module.opcodes
+        idx = self.start_idx + 1
+        while opcodes[idx] == _OPFUNCTIONPARAMETER:
+            idx += 1
+        return [FrozenInstruction(self.module, param_idx)
+                for param_idx in range(self.start_idx + 1, idx)]
+
+    @property
+    def basic_blocks(self):
+        """The basic blocks of the function."""
+        labels = self.module.label_indices
+        first = bisect.bisect_left(labels, self.start_idx)
+        last = bisect.bisect_left(labels, self.end_idx)
+        ends = list(labels[first + 1:last]) + [self.end_idx]
+        return [FrozenBasicBlock(self.module, label_idx, end_idx)
+                for label_idx, end_idx in zip(labels[first:last], ends)]
+
+    def instructions(self):
+        """Iterate over all instructions in the function."""
+        for idx in range(self.start_idx, self.end_idx + 1):
+            yield FrozenInstruction(self.module, idx)
+
+    def instructions_reversed(self):
+        """Iterate in reverse order over all instructions in the function."""
+        for idx in range(self.end_idx, self.start_idx - 1, -1):
+            yield FrozenInstruction(self.module, idx)
+
+
+class _FrozenGlobalInstructions(object):
+    """Read-only view of the global instructions in a FrozenModule."""
+    __slots__ = ['module', 'end_idx']
+
+    def __init__(self, module, end_idx):
+        self.module = module
+        self.end_idx = end_idx
+
+    def __str__(self):
+        return 'global instructions pseudo-BB'
+
+    def instructions(self):
+        """Iterate over all global instructions."""
+        for idx in range(self.end_idx):
+            yield FrozenInstruction(self.module, idx)
+
+    def instructions_reversed(self):
+        """Iterate in reverse order over all global instructions."""
+        for idx in range(self.end_idx - 1, -1, -1):
+            yield FrozenInstruction(self.module, idx)
+
+
+class FrozenModule(object):
+    """Read-only module created from the words of a SPIR-V binary.
+
+    The words may be an array.array or a memoryview of 32-bit words (see
+    read_spirv.SpirvBinary). The instructions are described by the arrays
+
+      opcodes     -- the opcode of each instruction
+      offsets     -- the index of the first word of each instruction (with
+                     an extra element containing the length of words)
+      type_ids    -- the type ID value of each instruction (or 0)
+      result_ids  -- the result ID value of each instruction (or 0)
+
+    and label_indices contains the indices of the OpLabel instructions.
+    The arrays can be wrapped in e.g. numpy.frombuffer without copying.
+
+    Only the header, the instruction lengths and opcodes, and the placement
+    of the functions and basic blocks are validated when the module is
+    created -- errors in the operands are reported when they are decoded."""
+    def __init__(self, words):
+        binary = read_spirv.SpirvBinary(words)
+        self.words = binary.words
+        self.bound = self.words[3]
+        self.value_to_id = _FrozenIds(self)
+        self.opcodes = array.array('H')
+        self.offsets = array.array('I')
+        self.type_ids = array.array('I')
+        self.result_ids = array.array('I')
+        self.label_indices = array.array('I')
+        self._function_indices = array.array('I')
+        self._result_index = None
+        self._users_index = None
+        self._parse(binary.idx)
+
+    def _parse(self, idx):
+        """Fill in the arrays from the words, starting at word idx."""
+        words = self.words
+        nof_words = len(words)
+        decoders = read_spirv._INST_DECODERS
+        function_starts = []
+        function_ends = []
+        in_function = False
+        in_basic_block = False
+        while idx < nof_words:
+            word = words[idx]
+            opcode = word & 0xFFFF
+            end = idx + (word >> 16)
+            if end == idx:
+                raise read_spirv.ParseError('Incorrect instruction length')
+            if end > nof_words:
+                raise read_spirv.ParseError('Unexpected end of file')
+            if opcode >= len(decoders) or decoders[opcode] is None:
+                raise read_spirv.ParseError('Invalid opcode ' + str(opcode))
+            _, has_type, has_result, _, _ = decoders[opcode]
+            if idx + has_type + has_result >= end:
+                raise read_spirv.ParseError('Incorrect instruction length')
+            inst_idx = len(self.opcodes)
+            self.opcodes.append(opcode)
+            self.offsets.append(idx)
+            self.type_ids.append(words[idx + 1] if has_type else 0)
+            self.result_ids.append(words[idx + 1 + has_type]
+                                   if has_result else 0)
+
+            if opcode == _OPFUNCTION:
+                if in_function:
+                    raise read_spirv.ParseError(
+                        'Invalid opcode OpFunction in function')
+                in_function = True
+                function_starts.append(inst_idx)
+            elif opcode == _OPFUNCTIONEND:
+                if not in_function or in_basic_block:
+                    raise read_spirv.ParseError('Invalid opcode OpFunctionEnd')
+                in_function = False
+                function_ends.append(inst_idx)
+            elif opcode == _OPLABEL:
+                if not in_function or in_basic_block:
+                    raise read_spirv.ParseError('Invalid opcode OpLabel')
+                in_basic_block = True
+                self.label_indices.append(inst_idx)
+            elif in_basic_block:
+                if ir.OPCODE_TO_OPNAME[opcode] in ir.BRANCH_INSTRUCTIONS:
+                    in_basic_block = False
+            elif function_starts and opcode != _OPFUNCTIONPARAMETER:
+                raise read_spirv.ParseError(
+                    'Invalid opcode ' + ir.OPCODE_TO_OPNAME[opcode])
+            idx = end
+        if in_function:
+            raise read_spirv.ParseError('Unexpected end of file')
+        self.offsets.append(nof_words)
+
+        self.functions = [FrozenFunction(self, start_idx, end_idx)
+                          for start_idx, end_idx in zip(function_starts,
+                                                        function_ends)]
+        self._function_indices = array.array('I', function_starts)
+        first_function = function_starts[0] if function_starts else len(
+            self.opcodes)
+        self.global_instructions = _FrozenGlobalInstructions(self,
+                                                             first_function)
+
+    @classmethod
+    def from_module(cls, module):
+        """Create a FrozenModule from an ir.Module."""
+        return cls(write_spirv.encode_module(module))
+
+    def __len__(self):
+        return len(self.opcodes)
+
+    def _get_function(self, idx):
+        """Return the function containing instruction idx, or None."""
+        pos = bisect.bisect_right(self._function_indices, idx) - 1
+        if pos < 0 or idx > self.functions[pos].end_idx:
+            return None
+        return self.functions[pos]
+
+    def _get_basic_block(self, idx):
+        """Return the basic block containing instruction idx, or None."""
+        if idx < self.global_instructions.end_idx:
+            return self.global_instructions
+        function = self._get_function(idx)
+        labels = self.label_indices
+        pos = bisect.bisect_right(labels, idx) - 1
+        if (function is None or idx == function.end_idx or pos < 0 or
+                labels[pos] < function.start_idx):
+            return None
+        if pos + 1 < len(labels) and labels[pos + 1] < function.end_idx:
+            end_idx = labels[pos + 1]
+        else:
+            end_idx = function.end_idx
+        return FrozenBasicBlock(self, labels[pos], end_idx)
+
+    def instructions(self):
+        """Iterate over all instructions in the module."""
+        for idx in range(len(self.opcodes)):
+            yield FrozenInstruction(self, idx)
+
+    def instructions_reversed(self):
+        """Iterate in reverse order over all instructions in the module."""
+        for idx in range(len(self.opcodes) - 1, -1, -1):
+            yield FrozenInstruction(self, idx)
+
+    def get_inst_by_id(self, value):
+        """Return the instruction having the result ID value, or None."""
+        if self._result_index is None:
+            self._result_index = dict(
+                (result_id, idx) for idx, result_id in
+                enumerate(self.result_ids) if result_id)
+        idx = self._result_index.get(value)
+        if idx is None:
+            return None
+        return FrozenInstruction(self, idx)
+
+    def opcode_histogram(self):
+        """Return a Counter mapping operation name to number of uses."""
+        counts = collections.Counter(self.opcodes)
+        return collections.Counter(
+            dict((ir.OPCODE_TO_OPNAME[opcode], count)
+                 for opcode, count in counts.items()))
+
+    def find_instructions(self, op_name):
+        """Return all instructions with the operation name op_name."""
+        opcode = spirv.spv['Op'][op_name]
+        opcodes = self.opcodes
+        result = []
+        idx = -1
+        try:
+            while True:
+                idx = opcodes.index(opcode, idx + 1)
+                result.append(FrozenInstruction(self, idx))
+        except ValueError:
+            return result
+
+    def users(self, value):
+        """Return the instructions using the ID value, in module order.
+
+        The uses of all IDs are computed (by decoding all instructions)
+        the first time this is called."""
+        if self._users_index is None:
+            users_index = collections.defaultdict(lambda: array.array('I'))
+            type_ids = self.type_ids
+            for idx in range(len(self.opcodes)):
+                if type_ids[idx]:
+                    users_index[type_ids[idx]].append(idx)
+                seen = set()
+                for operand in FrozenInstruction(self, idx).operands:
+                    if (isinstance(operand, FrozenId) and
+                            operand.value not in seen and
+                            operand.value != type_ids[idx]):
+                        seen.add(operand.value)
+                        users_index[operand.value].append(idx)
+            self._users_index = dict(users_index)
+        return [FrozenInstruction(self, idx)
+                for idx in self._users_index.get(value, ())]
+
+    def dump(self, stream=sys.stdout):
+        """Write debug dump to stream."""
+        for inst in self.instructions():
+            stream.write(str(inst) + '\n')
+
+
+def read_module(stream):
+    """Create a FrozenModule from a SPIR-V binary read from stream."""
+    data = stream.read()
+    if len(data) % 4 != 0:
+        raise read_spirv.ParseError('File length is not divisible by 4')
+    return FrozenModule(array.array('I', data))
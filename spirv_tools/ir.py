@@ -1,5 +1,9 @@
+import array
+import collections
+import copy
 import struct
 import sys
+import threading
 
 from spirv_tools import ext_inst
 from spirv_tools import inst_format
@@ -10,11 +14,263 @@ class IRError(Exception):
     """Raised when incorrect IR is created/detected."""
 
 
+# Compact representation of a module, as created by Module.to_snapshot.
+# Instruction i has the opcode opcodes[i], and its type_id and result_id
+# are given as indices into the ID table id_values (or -1 if the
+# instruction does not have a type or result), where temporary IDs have
+# the value 0. Its operands are
+# operand_kinds/operand_values[operand_ends[i-1]:operand_ends[i]], where
+# the kind tells if the value is an ID index, an integer, an index into
+# strings, or an index into objects (used for e.g. mask lists).
+ModuleSnapshot = collections.namedtuple('ModuleSnapshot', [
+    'bound', 'id_values', 'strings', 'objects', 'opcodes',
+    'type_ids', 'result_ids', 'operand_ends', 'operand_kinds',
+    'operand_values'])
+
+
 class Module(object):
     def __init__(self):
         self.bound = 1
-        self.functions = []
+        self.functions = _LinkedList()
         self.global_instructions = _GlobalInstructions(self)
+        self.source_words = None
+        # The temporary IDs are numbered per module, so that the result
+        # does not depend on other modules processed in the same process.
+        self._temp_id_counter = 0
+        self._temp_id_lock = threading.Lock()
+        # The passes.PassStatistics counting the created and destroyed
+        # instructions and the allocated IDs while a pass is recorded, or
+        # None when nothing is recorded.
+        self._statistics = None
+
+    def __getstate__(self):
+        # The object graph is too deep to be pickled recursively, so the
+        # module is pickled as a snapshot.
+        return self.to_snapshot()
+
+    def __setstate__(self, state):
+        self.__init__()
+        self._load_snapshot(state)
+
+    def to_snapshot(self):
+        """Return a compact, picklable ModuleSnapshot of the module.
+
+        The snapshot stores the instructions in flat arrays, where the IDs
+        are represented as indices into the ID table, and the strings
+        (enumerated constants and literal strings) as indices into a string
+        table. A module is re-created from the snapshot by from_snapshot."""
+        id_indices = {}
+        id_values = array.array('I')
+        string_indices = {}
+        strings = []
+        objects = []
+        opcodes = array.array('H')
+        type_ids = array.array('i')
+        result_ids = array.array('i')
+        operand_ends = array.array('I')
+        operand_kinds = array.array('B')
+        operand_values = array.array('q')
+        opname_to_opcode = spirv.spv['Op']
+        for inst in self.instructions():
+            opcodes.append(opname_to_opcode[inst.op_name])
+            for id_obj, id_array in [(inst.type_id, type_ids),
+                                     (inst.result_id, result_ids)]:
+                if id_obj is None:
+                    id_array.append(-1)
+                    continue
+                if id_obj not in id_indices:
+                    id_indices[id_obj] = len(id_values)
+                    id_values.append(0 if id_obj.is_temp else id_obj.value)
+                id_array.append(id_indices[id_obj])
+            for operand in inst.operands:
+                if isinstance(operand, Id):
+                    if operand not in id_indices:
+                        id_indices[operand] = len(id_values)
+                        id_values.append(
+                            0 if operand.is_temp else operand.value)
+                    operand_kinds.append(_SNAPSHOT_ID)
+                    operand_values.append(id_indices[operand])
+                elif isinstance(operand, str):
+                    if operand not in string_indices:
+                        string_indices[operand] = len(strings)
+                        strings.append(operand)
+                    operand_kinds.append(_SNAPSHOT_STRING)
+                    operand_values.append(string_indices[operand])
+                elif (isinstance(operand, int) and
+                      -(1 << 63) <= operand < (1 << 63)):
+                    operand_kinds.append(_SNAPSHOT_INT)
+                    operand_values.append(operand)
+                else:
+                    operand_kinds.append(_SNAPSHOT_OBJECT)
+                    operand_values.append(len(objects))
+                    objects.append(operand)
+            operand_ends.append(len(operand_values))
+        return ModuleSnapshot(self.bound, id_values, strings, objects,
+                              opcodes, type_ids, result_ids, operand_ends,
+                              operand_kinds, operand_values)
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """Create a module from a ModuleSnapshot returned by to_snapshot.
+
+        Temporary IDs in the snapshot get new temporary IDs in the
+        created module."""
+        module = cls()
+        module._load_snapshot(snapshot)
+        return module
+
+    def _load_snapshot(self, snapshot):
+        """Create the content of this (empty) module from snapshot."""
+        ids = [Id(self, value) if value else Id(self)
+               for value in snapshot.id_values]
+        strings = snapshot.strings
+        objects = snapshot.objects
+        operand_kinds = snapshot.operand_kinds
+        operand_values = snapshot.operand_values
+        opcode_to_opname = OPCODE_TO_OPNAME
+        function = None
+        basic_block = None
+        start = 0
+        for opcode, type_idx, result_idx, end in zip(snapshot.opcodes,
+                                                     snapshot.type_ids,
+                                                     snapshot.result_ids,
+                                                     snapshot.operand_ends):
+            op_name = opcode_to_opname[opcode]
+            type_id = None if type_idx < 0 else ids[type_idx]
+            result_id = None if result_idx < 0 else ids[result_idx]
+            operands = []
+            for idx in range(start, end):
+                kind = operand_kinds[idx]
+                if kind == _SNAPSHOT_ID:
+                    operands.append(ids[operand_values[idx]])
+                elif kind == _SNAPSHOT_STRING:
+                    operands.append(strings[operand_values[idx]])
+                elif kind == _SNAPSHOT_INT:
+                    operands.append(operand_values[idx])
+                else:
+                    operands.append(copy.deepcopy(objects[operand_values[idx]]))
+            start = end
+
+            if op_name == 'OpFunction':
+                function = Function(self, operands[0], operands[1],
+                                    result_id=result_id)
+            elif op_name == 'OpFunctionEnd':
+                self.functions.append(function)
+                function = None
+            elif op_name == 'OpLabel':
+                basic_block = BasicBlock(self, result_id)
+                function.append_basic_block(basic_block)
+            else:
+                inst = Instruction(self, op_name, type_id, operands,
+                                   result_id=result_id)
+                if function is None:
+                    self.global_instructions.append_inst(inst)
+                elif op_name == 'OpFunctionParameter':
+                    function.append_parameter(inst)
+                else:
+                    # The instructions are known to be valid, so we
+                    # bypass the checks in BasicBlock.append_inst.
+                    basic_block.insts.append(inst)
+                    inst.basic_block = basic_block
+                    inst.function = function
+                    _add_use_to_id(inst)
+        self.bound = snapshot.bound
+
+    def clone(self, copy_on_write=False):
+        """Return a copy of the module.
+
+        The copy is created in one pass over the instructions, where the
+        copied instructions get new Id objects (with the same values, except
+        that temporary IDs get new temporary IDs).
+
+        If copy_on_write is True, the functions that have not been modified
+        since the module was read from a binary are not copied -- their
+        bodies are decoded from the binary (which is shared between the
+        modules) when they are first used in the copy."""
+        module = Module()
+        id_map = {}
+
+        def clone_id(id_obj):
+            new_id = id_map.get(id_obj)
+            if new_id is None:
+                if id_obj.is_temp:
+                    new_id = Id(module)
+                else:
+                    new_id = Id(module, id_obj.value)
+                id_map[id_obj] = new_id
+            return new_id
+
+        def clone_inst(inst):
+            operands = []
+            for operand in inst.operands:
+                if isinstance(operand, Id):
+                    operand = clone_id(operand)
+                elif isinstance(operand, list):
+                    operand = copy.deepcopy(operand)
+                operands.append(operand)
+            return Instruction(
+                module, inst.op_name,
+                None if inst.type_id is None else clone_id(inst.type_id),
+                operands,
+                None if inst.result_id is None else clone_id(inst.result_id))
+
+        for inst in self.global_instructions.instructions():
+            module.global_instructions.append_inst(clone_inst(inst))
+
+        source_words = self.source_words
+        shared_functions = []
+        for function in self.functions:
+            new_function = Function(module,
+                                    copy.deepcopy(function.inst.operands[0]),
+                                    clone_id(function.inst.operands[1]),
+                                    result_id=clone_id(function.inst.result_id))
+            for inst in function.parameters:
+                new_function.append_parameter(clone_inst(inst))
+            is_unmodified = (source_words is not None and
+                             function.source_range is not None)
+            if copy_on_write and is_unmodified:
+                shared_functions.append(new_function)
+            else:
+                for basic_block in function.basic_blocks:
+                    new_basic_block = BasicBlock(
+                        module, clone_id(basic_block.inst.result_id))
+                    for inst in basic_block.insts:
+                        new_inst = clone_inst(inst)
+                        # The instructions are known to be valid, so we
+                        # bypass the checks in BasicBlock.append_inst.
+                        new_basic_block.insts.append(new_inst)
+                        new_inst.basic_block = new_basic_block
+                        _add_use_to_id(new_inst)
+                    new_function.append_basic_block(new_basic_block)
+            if is_unmodified:
+                new_function.source_range = function.source_range
+            module.append_function(new_function)
+
+        if source_words is not None:
+            module.source_words = source_words
+            module.global_instructions.source_ranges = (
+                self.global_instructions.source_ranges[:])
+        if shared_functions:
+            # read_spirv imports this module, so it cannot be imported at
+            # the top of the file.
+            from spirv_tools import read_spirv
+            value_to_id = dict((id_obj.value, new_id)
+                               for id_obj, new_id in id_map.items()
+                               if not id_obj.is_temp)
+            read_spirv.set_function_body_loaders(shared_functions,
+                                                 source_words, value_to_id)
+        module.bound = self.bound
+        return module
+
+    def _new_temp_id_value(self):
+        """Return the value for a new temporary ID.
+
+        This may be called from several threads concurrently."""
+        with self._temp_id_lock:
+            self._temp_id_counter += 1
+            if self._statistics is not None:
+                self._statistics.ids_allocated += 1
+            return self._temp_id_counter
 
     def dump(self, stream=sys.stdout):
         """Write debug dump to stream."""
@@ -23,17 +279,27 @@ class Module(object):
             stream.write('\n')
             function.dump(stream)
 
+    def discard_source_binary(self):
+        """Forget the binary the module was read from.
+
+        Unmodified functions and global instructions are written by copying
+        their words from the binary the module was read from. This must be
+        called if the module has been modified without using the API (such
+        as by changing an instruction's operands directly), so that all
+        instructions are re-encoded when the module is written."""
+        self.source_words = None
+
     def instructions(self):
         """Iterate over all instructions in the module."""
         for inst in self.global_instructions.instructions():
             yield inst
-        for function in self.functions[:]:
+        for function in self.functions:
             for inst in function.instructions():
                 yield inst
 
     def instructions_reversed(self):
         """Iterate in reverse order over all instructions in the module."""
-        for function in reversed(self.functions[:]):
+        for function in reversed(self.functions):
             for inst in function.instructions_reversed():
                 yield inst
         for inst in self.global_instructions.instructions_reversed():
@@ -42,7 +308,6 @@ class Module(object):
     def insert_global_inst(self, inst):
         """Insert a global instruction into the module."""
         self.global_instructions.append_inst(inst)
-        _add_use_to_id(inst)
 
     def get_global_inst(self, op_name, type_id, operands):
         """Return a global instruction.
@@ -58,17 +323,15 @@ class Module(object):
 
     def prepend_function(self, function):
         """Insert function at the top of the module."""
-        self.functions = [function] + self.functions
+        self.functions.prepend(function)
 
     def insert_function_after(self, function, insert_pos_function):
         """Insert function after an existing function."""
-        idx = self.functions.index(insert_pos_function)
-        self.functions.insert(idx + 1, function)
+        self.functions.insert_after(function, insert_pos_function)
 
     def insert_function_before(self, function, insert_pos_function):
         """Insert function before an existing function."""
-        idx = self.functions.index(insert_pos_function)
-        self.functions.insert(idx, function)
+        self.functions.insert_before(function, insert_pos_function)
 
     def get_constant(self, type_id, value):
         """Get a constant with the provided value and type.
@@ -124,43 +387,86 @@ class Module(object):
         # The temporary IDs are placed in a list (rather than e.g. a set)
         # so that we get deterministic result when we renumber by iterating
         # over the temporary IDs.
-        temp_ids = [inst.result_id for inst in self.instructions()
+        # Functions that have not been modified since they were read cannot
+        # contain temporary IDs, so they are skipped (which also avoids
+        # decoding their bodies if the module was read lazily).
+        temp_ids = [inst.result_id
+                    for inst in self.global_instructions.instructions()
                     if inst.result_id is not None and inst.result_id.is_temp]
-
-        # Create a new ID for each temporary ID, and update the instructions.
-        # The code modifies the instructions, which is "wrong" -- the correct
-        # way of handling this is to replace the old instruction with a
-        # cloned instruction having the new ID. But the API does currently
-        # not handle cloning/replacing OpFunction, OpFunctionParameter, or
-        # OpLabel (and you could argue it does not need to, as no application
-        # should do this kind of modification).
-        for old_id in temp_ids:
-            new_id = Id(self, self.bound)
-            old_id.inst.result_id = new_id
-            new_id.inst = old_id.inst
-            old_id.inst = None
-            for inst in old_id.uses:
-                if inst.type_id == old_id:
-                    inst.type_id = new_id
-                for i, operand in enumerate(inst.operands):
-                    if operand == old_id:
-                        inst.operands[i] = new_id
-            new_id.uses = old_id.uses
+        for function in self.functions:
+            if (self.source_words is not None and
+                    function.source_range is not None):
+                continue
+            temp_ids.extend([inst.result_id
+                             for inst in function.instructions()
+                             if (inst.result_id is not None and
+                                 inst.result_id.is_temp)])
+
+        # The ID objects are shared by all instructions using them, so the
+        # IDs are renumbered by updating the value in place. The defining
+        # instruction and the uses are only marked as modified.
+        for id_obj in temp_ids:
+            id_obj.value = self.bound
+            id_obj.is_temp = False
+            self.bound += 1
+            _mark_modified(id_obj.inst)
+            for inst in id_obj._users():
+                _mark_modified(inst)
+            for inst in id_obj._annotation_users():
+                _mark_modified(inst)
+
+    def compact_ids(self):
+        """Renumber all IDs densely (1..N) in the order they are defined.
+
+        This removes the holes in the ID numbering left by destroyed IDs,
+        so the bound is as small as possible, and the result does not
+        depend on the order the IDs were created in. All instructions are
+        re-encoded when the module is written."""
+        new_values = {}
+        undefined_ids = []
+        for inst in self.instructions():
+            if inst.result_id is not None:
+                new_values[inst.result_id] = len(new_values) + 1
+            if inst.type_id is not None and inst.type_id not in new_values:
+                undefined_ids.append(inst.type_id)
+            for operand in inst.operands:
+                if isinstance(operand, Id) and operand not in new_values:
+                    undefined_ids.append(operand)
+        # IDs used before they are defined (such as in OpName) end up in
+        # undefined_ids too, so only the IDs that are not defined at all
+        # are numbered here (after all defined IDs).
+        for id_obj in undefined_ids:
+            if id_obj not in new_values:
+                new_values[id_obj] = len(new_values) + 1
+        for id_obj, value in new_values.items():
+            id_obj.value = value
+            id_obj.is_temp = False
+        self.bound = len(new_values) + 1
+        self.source_words = None
 
 
 class _GlobalInstructions(object):
     def __init__(self, module):
         self.module = module
-        self.op_capability_insts = []
-        self.op_extension_insts = []
-        self.op_extinstimport_insts = []
-        self.op_memory_model_insts = []
-        self.op_entry_point_insts = []
-        self.op_execution_mode_insts = []
-        self.op_string_insts = []
-        self.name_insts = []
-        self.decoration_insts = []
-        self.type_insts = []
+        self.op_capability_insts = _LinkedList()
+        self.op_extension_insts = _LinkedList()
+        self.op_extinstimport_insts = _LinkedList()
+        self.op_memory_model_insts = _LinkedList()
+        self.op_entry_point_insts = _LinkedList()
+        self.op_execution_mode_insts = _LinkedList()
+        self.op_string_insts = _LinkedList()
+        self.name_insts = _LinkedList()
+        self.decoration_insts = _LinkedList()
+        self.type_insts = _LinkedList()
+        # The (start, end) word range of each list in the binary the module
+        # was read from, or None if the list has been modified.
+        self.source_ranges = [None] * 10
+        # Index from the (op_name, type_id, operands) key to the instructions
+        # having that key, used by get_inst. It is created the first time it
+        # is needed. The key used for each instruction is kept in inst_keys,
+        # so that the instruction can be found when its operands change.
+        self._inst_index = None
+        self._inst_keys = None
 
     def __str__(self):
         return 'global instructions pseudo-BB'
@@ -224,72 +530,75 @@ class _GlobalInstructions(object):
             raise IRError(op_name + ' is not a valid global instruction')
         return insts_list, order
 
+    def sections(self):
+        """Return the lists of global instructions, in binary order."""
+        return [self.op_capability_insts,
+                self.op_extension_insts,
+                self.op_extinstimport_insts,
+                self.op_memory_model_insts,
+                self.op_entry_point_insts,
+                self.op_execution_mode_insts,
+                self.op_string_insts,
+                self.name_insts,
+                self.decoration_insts,
+                self.type_insts]
+
     def instructions(self):
         """Iterate over all global instructions."""
-        for inst in self.op_capability_insts[:]:
-            if inst.basic_block is not None:
-                yield inst
-        for inst in self.op_extension_insts[:]:
-            if inst.basic_block is not None:
-                yield inst
-        for inst in self.op_extinstimport_insts[:]:
-            if inst.basic_block is not None:
-                yield inst
-        for inst in self.op_memory_model_insts[:]:
-            if inst.basic_block is not None:
-                yield inst
-        for inst in self.op_entry_point_insts[:]:
-            if inst.basic_block is not None:
-                yield inst
-        for inst in self.op_execution_mode_insts[:]:
-            if inst.basic_block is not None:
-                yield inst
-        for inst in self.op_string_insts[:]:
-            if inst.basic_block is not None:
-                yield inst
-        for inst in self.name_insts[:]:
-            if inst.basic_block is not None:
-                yield inst
-        for inst in self.decoration_insts[:]:
-            if inst.basic_block is not None:
-                yield inst
-        for inst in self.type_insts[:]:
-            if inst.basic_block is not None:
+        for insts_list in self.sections():
+            for inst in insts_list:
                 yield inst
 
     def instructions_reversed(self):
         """Iterate in reverse order over all global instructions."""
-        for inst in reversed(self.type_insts[:]):
-            if inst.basic_block is not None:
-                yield inst
-        for inst in reversed(self.decoration_insts[:]):
-            if inst.basic_block is not None:
-                yield inst
-        for inst in reversed(self.name_insts[:]):
-            if inst.basic_block is not None:
-                yield inst
-        for inst in reversed(self.op_string_insts[:]):
-            if inst.basic_block is not None:
-                yield inst
-        for inst in reversed(self.op_execution_mode_insts[:]):
-            if inst.basic_block is not None:
-                yield inst
-        for inst in reversed(self.op_entry_point_insts[:]):
-            if inst.basic_block is not None:
-                yield inst
-        for inst in reversed(self.op_memory_model_insts[:]):
-            if inst.basic_block is not None:
-                yield inst
-        for inst in reversed(self.op_extinstimport_insts[:]):
-            if inst.basic_block is not None:
-                yield inst
-        for inst in reversed(self.op_extension_insts[:]):
-            if inst.basic_block is not None:
-                yield inst
-        for inst in reversed(self.op_capability_insts[:]):
-            if inst.basic_block is not None:
+        for insts_list in reversed(self.sections()):
+            for inst in reversed(insts_list):
                 yield inst
 
+    def get_marker(self):
+        """Return a marker for the current state, used by inserted_since."""
+        return [insts_list._generation for insts_list in self.sections()]
+
+    def inserted_since(self, marker):
+        """Return the instructions inserted after marker was created.
+
+        The result is a list of (inst, prev_inst) pairs in binary order,
+        where prev_inst is the instruction before inst in its list (or None
+        if inst is the first instruction in the list)."""
+        result = []
+        for insts_list, generation in zip(self.sections(), marker):
+            if insts_list._generation == generation:
+                continue
+            prev_inst = None
+            for inst in insts_list:
+                if inst._stamp > generation:
+                    result.append((inst, prev_inst))
+                prev_inst = inst
+        return result
+
+    def _add_to_index(self, inst):
+        """Add inst to the index used by get_inst (if it is created)."""
+        if self._inst_index is not None:
+            key = inst.structural_key()
+            self._inst_keys[inst] = key
+            self._inst_index.setdefault(key, []).append(inst)
+
+    def _remove_from_index(self, inst):
+        """Remove inst from the index used by get_inst (if it is created)."""
+        if self._inst_index is not None:
+            key = self._inst_keys.pop(inst)
+            insts = self._inst_index[key]
+            insts.remove(inst)
+            if not insts:
+                del self._inst_index[key]
+
+    def _inst_modified(self, inst):
+        """Update the source range and index after inst has been modified."""
+        _, order = self._get_insts_list(inst.op_name)
+        self.source_ranges[order] = None
+        self._remove_from_index(inst)
+        self._add_to_index(inst)
+
     def get_inst(self, op_name, type_id, operands):
         """Return a global instruction.
 
@@ -297,37 +606,51 @@ class _GlobalInstructions(object):
         global instruction is created and inserted in the module if no
         such instruction is available."""
         insts_list, _ = self._get_insts_list(op_name)
-        for inst in insts_list:
-            if (inst.op_name == op_name and
-                    inst.type_id == type_id and
-                    inst.operands == operands):
-                return inst
+        if self._inst_index is None:
+            self._inst_index = {}
+            self._inst_keys = {}
+            for inst in self.instructions():
+                self._add_to_index(inst)
+        insts = self._inst_index.get(_inst_key(op_name, type_id, operands))
+        if insts:
+            if len(insts) == 1:
+                return insts[0]
+            # Return the first of the identical instructions.
+            for inst in insts_list:
+                if inst in insts:
+                    return inst
         inst = Instruction(self.module, op_name, type_id, operands)
         self.append_inst(inst)
         return inst
 
     def append_inst(self, inst):
         """Insert inst at the end of the global instructions of its kind."""
-        insts_list, _ = self._get_insts_list(inst.op_name)
+        insts_list, order = self._get_insts_list(inst.op_name)
         insts_list.append(inst)
         inst.basic_block = self
+        self.source_ranges[order] = None
+        self._add_to_index(inst)
         _add_use_to_id(inst)
 
     def prepend_inst(self, inst):
         """Insert inst at the top of the global instructions of its kind."""
-        insts_list, _ = self._get_insts_list(inst.op_name)
-        insts_list.insert(0, inst)
+        insts_list, order = self._get_insts_list(inst.op_name)
+        insts_list.prepend(inst)
         inst.basic_block = self
+        self.source_ranges[order] = None
+        self._add_to_index(inst)
         _add_use_to_id(inst)
 
     def insert_inst_after(self, inst, insert_pos_inst):
         """Insert instruction after an existing instruction."""
-        insert_pos_list, insert_ord = self._get_insts_list(insert_pos_inst)
+        insert_pos_list, insert_ord = self._get_insts_list(
+            insert_pos_inst.op_name)
         insts_list, inst_ord = self._get_insts_list(inst.op_name)
-        if insert_pos_list == insts_list:
-            idx = insert_pos_list.index(insert_pos_inst)
-            insert_pos_list.insert(idx + 1, inst)
+        if insert_pos_list is insts_list:
+            insert_pos_list.insert_after(inst, insert_pos_inst)
             inst.basic_block = self
+            self.source_ranges[inst_ord] = None
+            self._add_to_index(inst)
             _add_use_to_id(inst)
         else:
             if inst_ord > insert_ord:
@@ -340,11 +663,12 @@ class _GlobalInstructions(object):
         """Insert instruction before an existing instruction."""
         insert_list, insert_ord = self._get_insts_list(insert_pos_inst.op_name)
         insts_list, inst_ord = self._get_insts_list(inst.op_name)
-        if insert_list == insts_list:
-            idx = insert_list.index(insert_pos_inst)
-            insert_list.insert(idx, inst)
+        if insert_list is insts_list:
+            insert_list.insert_before(inst, insert_pos_inst)
             inst.basic_block = self
             inst.function = self.function
+            self.source_ranges[inst_ord] = None
+            self._add_to_index(inst)
             _add_use_to_id(inst)
         else:
             if inst_ord < insert_ord:
@@ -355,17 +679,27 @@ class _GlobalInstructions(object):
 
     def remove_inst(self, inst):
         """Remove the inst instruction from global instructions."""
-        _remove_use_from_id(inst)
-        insts_list, _ = self._get_insts_list(inst.op_name)
+        insts_list, order = self._get_insts_list(inst.op_name)
         insts_list.remove(inst)
+        _remove_use_from_id(inst)
         inst.basic_block = None
+        self.source_ranges[order] = None
+        self._remove_from_index(inst)
 
 
 class Function(object):
     def __init__(self, module, function_control, type_id, result_id=None):
         self.module = module
-        self.parameters = []
-        self.basic_blocks = []
+        self.parameters = _LinkedList()
+        self.basic_blocks = _LinkedList()
+        # _prev, _next, _stamp, and _list are used by _LinkedList.
+        self._prev = None
+        self._next = None
+        self._stamp = 0
+        self._list = None
+        # The (start, end) word range of the function in the binary the
+        # module was read from, or None if the function has been modified.
+        self.source_range = None
         self.inst = Instruction(self.module, 'OpFunction',
                                 type_id.inst.operands[0],
                                 [function_control, type_id],
@@ -379,15 +713,49 @@ class Function(object):
     def __str__(self):
         return str(self.inst)
 
+    def __getattr__(self, name):
+        # This is only called when the attribute is missing, which is the
+        # case for basic_blocks when the function has a body loader.
+        if name == 'basic_blocks' and '_body_loader' in self.__dict__:
+            body_loader = self.__dict__.pop('_body_loader')
+            self.basic_blocks = _LinkedList()
+            # The decoded instructions are not created by the running pass.
+            statistics = self.module._statistics
+            self.module._statistics = None
+            try:
+                body_loader(self)
+            finally:
+                self.module._statistics = statistics
+            return self.basic_blocks
+        raise AttributeError(name)
+
+    def set_body_loader(self, body_loader):
+        """Create the basic blocks by calling body_loader when first used.
+
+        The function must not have any basic blocks. The body_loader is
+        called with the function as argument the first time basic_blocks
+        is accessed, and it is expected to append the basic blocks."""
+        if self.basic_blocks:
+            raise IRError('Function already has basic blocks')
+        del self.basic_blocks
+        self._body_loader = body_loader
+
+    def is_body_decoded(self):
+        """Return False if the body is to be created by a body loader.
+
+        The body loader is called when basic_blocks is first accessed, so
+        this can be used for avoiding decoding the body."""
+        return '_body_loader' not in self.__dict__
+
     def destroy(self):
         """Destroy the function.
 
         This destroys all basic blocks and instructions used in the function.
         The function must not be used after it is destroyed."""
         self.module.functions.remove(self)
-        for basic_block in reversed(self.basic_blocks[:]):
+        for basic_block in reversed(self.basic_blocks):
             basic_block.destroy()
-        for inst in self.parameters[:]:
+        for inst in self.parameters:
             _remove_use_from_id(inst)
             inst.destroy()
         _remove_use_from_id(self.end_inst)
@@ -416,27 +784,23 @@ class Function(object):
     def instructions(self):
         """Iterate over all instructions in the function."""
         yield self.inst
-        for inst in self.parameters[:]:
-            if inst in self.parameters:
-                yield inst
-        for basic_block in self.basic_blocks[:]:
+        for inst in self.parameters:
+            yield inst
+        for basic_block in self.basic_blocks:
             yield basic_block.inst
-            for inst in basic_block.insts[:]:
-                if inst.basic_block is not None:
-                    yield inst
+            for inst in basic_block.insts:
+                yield inst
         yield self.end_inst
 
     def instructions_reversed(self):
         """Iterate in reverse order over all instructions in the function."""
         yield self.end_inst
-        for basic_block in reversed(self.basic_blocks[:]):
-            for inst in reversed(basic_block.insts[:]):
-                if inst.basic_block is not None:
-                    yield inst
-            yield basic_block.inst
-        for inst in reversed(self.parameters[:]):
-            if inst in self.parameters:
+        for basic_block in reversed(self.basic_blocks):
+            for inst in reversed(basic_block.insts):
                 yield inst
+            yield basic_block.inst
+        for inst in reversed(self.parameters):
+            yield inst
         yield self.inst
 
     def append_parameter(self, inst):
@@ -453,11 +817,13 @@ class Function(object):
             raise IRError('Incorrect parameter type')
         self.parameters.append(inst)
         inst.function = self
+        self.source_range = None
         _add_use_to_id(inst)
 
     def append_basic_block(self, basic_block):
         """Insert basic block at the end of the function."""
         self.basic_blocks.append(basic_block)
+        self.source_range = None
         basic_block.function = self
         basic_block.inst.function = self
         for inst in basic_block.insts:
@@ -465,7 +831,8 @@ class Function(object):
 
     def prepend_basic_block(self, basic_block):
         """Insert basic block at the top of the function."""
-        self.basic_blocks = [basic_block] + self.basic_blocks
+        self.basic_blocks.prepend(basic_block)
+        self.source_range = None
         basic_block.function = self
         basic_block.inst.function = self
         for inst in basic_block.insts:
@@ -473,8 +840,8 @@ class Function(object):
 
     def insert_basic_block_after(self, basic_block, insert_pos_basic_block):
         """Insert basic block after an existing basic block."""
-        idx = self.basic_blocks.index(insert_pos_basic_block)
-        self.basic_blocks.insert(idx + 1, basic_block)
+        self.basic_blocks.insert_after(basic_block, insert_pos_basic_block)
+        self.source_range = None
         basic_block.function = self
         basic_block.inst.function = self
         for inst in basic_block.insts:
@@ -482,23 +849,204 @@ class Function(object):
 
     def insert_basic_block_before(self, basic_block, insert_pos_basic_block):
         """Insert basic block before an existing basic block."""
-        idx = self.basic_blocks.index(insert_pos_basic_block)
-        self.basic_blocks.insert(idx, basic_block)
+        self.basic_blocks.insert_before(basic_block, insert_pos_basic_block)
+        self.source_range = None
         basic_block.function = self
         basic_block.inst.function = self
         for inst in basic_block.insts:
             inst.function = self
 
 
+class _Cursor(object):
+    """The position of an iteration over a _LinkedList."""
+    __slots__ = ['node', 'forward']
+
+    def __init__(self, forward):
+        self.node = None
+        self.forward = forward
+
+
+class _LinkedList(object):
+    """Doubly linked list of instructions, basic blocks, or functions.
+
+    Nodes can be inserted and removed in constant time when the position
+    is given by a node in the list. The links are stored in the nodes
+    (in the _prev, _next, _stamp, and _list attributes), so a node can
+    only be in one list at a time.
+
+    It is allowed to insert and remove nodes while iterating over the list,
+    and the iteration does not need to copy the list. Removed nodes are
+    not returned (unless they were returned before they were removed), and
+    nodes inserted (or moved) after the iteration started are not returned.
+
+    The list also supports len(), 'in', indexing, and slicing (where the
+    slices are returned as Python lists), but indexing is linear in the
+    distance from the start or end of the list."""
+    __slots__ = ['_head', '_tail', '_len', '_generation', '_cursors']
+
+    def __init__(self, nodes=()):
+        self._head = None
+        self._tail = None
+        self._len = 0
+        # Each inserted node is stamped with a new generation, so that an
+        # iteration can skip the nodes inserted after it started.
+        self._generation = 0
+        self._cursors = []
+        for node in nodes:
+            self.append(node)
+
+    def __len__(self):
+        return self._len
+
+    def __contains__(self, node):
+        return getattr(node, '_list', None) is self
+
+    def __iter__(self):
+        generation = self._generation
+        cursor = _Cursor(True)
+        self._cursors.append(cursor)
+        try:
+            node = self._head
+            while node is not None:
+                if node._stamp <= generation:
+                    cursor.node = node
+                    yield node
+                    node = cursor.node
+                    node = self._head if node is None else node._next
+                else:
+                    node = node._next
+        finally:
+            self._remove_cursor(cursor)
+
+    def __reversed__(self):
+        generation = self._generation
+        cursor = _Cursor(False)
+        self._cursors.append(cursor)
+        try:
+            node = self._tail
+            while node is not None:
+                if node._stamp <= generation:
+                    cursor.node = node
+                    yield node
+                    node = cursor.node
+                    node = self._tail if node is None else node._prev
+                else:
+                    node = node._prev
+        finally:
+            self._remove_cursor(cursor)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            # The nodes are collected directly (instead of by list(self)),
+            # as this is much faster than iterating.
+            nodes = []
+            node = self._head
+            while node is not None:
+                nodes.append(node)
+                node = node._next
+            return nodes[idx]
+        if idx < -self._len or idx >= self._len:
+            raise IndexError('list index out of range')
+        if idx < 0:
+            node = self._tail
+            for _ in range(-idx - 1):
+                node = node._prev
+        else:
+            node = self._head
+            for _ in range(idx):
+                node = node._next
+        return node
+
+    def __str__(self):
+        return '[' + ', '.join(str(node) for node in self) + ']'
+
+    def _remove_cursor(self, cursor):
+        for idx, tmp_cursor in enumerate(self._cursors):
+            if tmp_cursor is cursor:
+                del self._cursors[idx]
+                return
+
+    def _link(self, node, prev_node, next_node):
+        """Insert node between prev_node and next_node."""
+        if node._list is not None:
+            raise ValueError('Node is already in a list')
+        self._generation += 1
+        node._stamp = self._generation
+        node._list = self
+        node._prev = prev_node
+        node._next = next_node
+        if prev_node is None:
+            self._head = node
+        else:
+            prev_node._next = node
+        if next_node is None:
+            self._tail = node
+        else:
+            next_node._prev = node
+        self._len += 1
+
+    def append(self, node):
+        """Insert node at the end of the list."""
+        self._link(node, self._tail, None)
+
+    def prepend(self, node):
+        """Insert node at the start of the list."""
+        self._link(node, None, self._head)
+
+    def insert_after(self, node, insert_pos_node):
+        """Insert node after insert_pos_node."""
+        if insert_pos_node._list is not self:
+            raise ValueError('Insert position is not in the list')
+        self._link(node, insert_pos_node, insert_pos_node._next)
+
+    def insert_before(self, node, insert_pos_node):
+        """Insert node before insert_pos_node."""
+        if insert_pos_node._list is not self:
+            raise ValueError('Insert position is not in the list')
+        self._link(node, insert_pos_node._prev, insert_pos_node)
+
+    def remove(self, node):
+        """Remove node from the list."""
+        if node._list is not self:
+            raise ValueError('Node is not in the list')
+        prev_node = node._prev
+        next_node = node._next
+        # Move the iterations currently at node to the previous position,
+        # so that they continue with the node after it.
+        for cursor in self._cursors:
+            if cursor.node is node:
+                cursor.node = prev_node if cursor.forward else next_node
+        if prev_node is None:
+            self._head = next_node
+        else:
+            prev_node._next = next_node
+        if next_node is None:
+            self._tail = prev_node
+        else:
+            next_node._prev = prev_node
+        node._prev = None
+        node._next = None
+        node._list = None
+        self._len -= 1
+
+
 class BasicBlock(object):
+    # _prev, _next, _stamp, and _list are used by _LinkedList.
+    __slots__ = ['function', 'module', 'inst', 'insts',
+                 '_prev', '_next', '_stamp', '_list']
+
     def __init__(self, module, label_id=None):
         self.function = None
         self.module = module
+        self._prev = None
+        self._next = None
+        self._stamp = 0
+        self._list = None
         self.inst = Instruction(self.module, 'OpLabel', None, [],
                                 result_id=label_id)
         _add_use_to_id(self.inst)
         self.inst.basic_block = self
-        self.insts = []
+        self.insts = _LinkedList()
 
     def __str__(self):
         return str(self.inst)
@@ -544,37 +1092,40 @@ class BasicBlock(object):
         self.insts.append(inst)
         inst.basic_block = self
         inst.function = self.function
+        _mark_modified(inst)
         _add_use_to_id(inst)
 
     def prepend_inst(self, inst):
         """Insert instruction at the top of the basic block."""
         if inst.is_global_inst():
             raise IRError(inst.op_name + ' is a global instruction')
-        self.insts = [inst] + self.insts
+        self.insts.prepend(inst)
         inst.basic_block = self
         inst.function = self.function
+        _mark_modified(inst)
         _add_use_to_id(inst)
 
     def insert_inst_after(self, inst, insert_pos_inst):
         """Insert instruction after an existing instruction."""
-        idx = self.insts.index(insert_pos_inst)
-        self.insts.insert(idx + 1, inst)
+        self.insts.insert_after(inst, insert_pos_inst)
         inst.basic_block = self
         inst.function = self.function
+        _mark_modified(inst)
         _add_use_to_id(inst)
 
     def insert_inst_before(self, inst, insert_pos_inst):
         """Insert instruction before an existing instruction."""
-        idx = self.insts.index(insert_pos_inst)
-        self.insts.insert(idx, inst)
+        self.insts.insert_before(inst, insert_pos_inst)
         inst.basic_block = self
         inst.function = self.function
+        _mark_modified(inst)
         _add_use_to_id(inst)
 
     def remove_inst(self, inst):
         """Remove instruction from basic block."""
-        _remove_use_from_id(inst)
         self.insts.remove(inst)
+        _remove_use_from_id(inst)
+        _mark_modified(inst)
         inst.basic_block = None
         inst.function = None
 
@@ -597,9 +1148,10 @@ class BasicBlock(object):
         if self.function is None:
             raise IRError('Basic block is not in function')
         self.function.basic_blocks.remove(self)
+        self.function.source_range = None
         self.function = None
         for inst in self.insts:
-            inst.function = self
+            inst.function = None
 
     def destroy(self):
         """Destroy the basic block.
@@ -613,9 +1165,16 @@ class BasicBlock(object):
         uses = self.inst.uses()
         for tmp_inst in uses:
             if tmp_inst.op_name == 'OpPhi':
-                tmp_inst.remove_from_phi(self)
-        for inst in reversed(self.insts[:]):
+                tmp_inst.remove_from_phi(self.inst.result_id)
+        for inst in reversed(self.insts):
+            inst.destroy()
+        # The OpLabel is not in insts, so its debug and decoration
+        # instructions are destroyed here.
+        for inst in self.inst.result_id._annotation_users():
             inst.destroy()
+        self.inst.result_id.inst = None
+        if self.module._statistics is not None:
+            self.module._statistics.insts_destroyed += 1
         self.module = None
         self.insts = None
 
@@ -628,6 +1187,12 @@ class BasicBlock(object):
 
 
 class Instruction(object):
+    # _prev, _next, _stamp, and _list are used by _LinkedList, and
+    # _structural_key caches the value returned by structural_key.
+    __slots__ = ['module', 'op_name', 'result_id', 'type_id', 'operands',
+                 'basic_block', 'function', '_prev', '_next', '_stamp',
+                 '_list', '_structural_key']
+
     def __init__(self, module, op_name, type_id, operands, result_id=None):
         if result_id is None:
             if op_name not in INST_FORMAT:
@@ -641,6 +1206,13 @@ class Instruction(object):
         self.operands = operands
         self.basic_block = None
         self.function = None
+        self._prev = None
+        self._next = None
+        self._stamp = 0
+        self._list = None
+        self._structural_key = None
+        if module._statistics is not None:
+            module._statistics.insts_created += 1
         if op_name == 'OpFunction':
             function_type_inst = operands[1].inst
             if function_type_inst.op_name != 'OpTypeFunction':
@@ -769,15 +1341,14 @@ class Instruction(object):
         instructions, from the module. The instruction must not be used
         after it is destroyed."""
         if self.result_id is not None:
-            uses = [inst for inst in self.result_id.uses
-                    if (inst.op_name in DECORATION_INSTRUCTIONS or
-                        inst.op_name in DEBUG_INSTRUCTIONS)]
-            for inst in uses:
+            for inst in self.result_id._annotation_users():
                 inst.destroy()
         if self.basic_block is not None:
             self.basic_block.remove_inst(self)
         if self.result_id is not None:
             self.result_id.inst = None
+        if self.module._statistics is not None:
+            self.module._statistics.insts_destroyed += 1
         self.basic_block = None
         self.function = None
         self.op_name = None
@@ -788,21 +1359,26 @@ class Instruction(object):
     def add_to_phi(self, variable_inst, parent_inst):
         """Add a variable/parent to a phi-node."""
         assert self.op_name == 'OpPhi'
+        _mark_modified(self)
         self.operands.append(variable_inst.result_id)
-        variable_inst.result_id.uses.add(self)
         self.operands.append(parent_inst.result_id)
-        parent_inst.result_id.uses.add(self)
+        if self.basic_block is not None:
+            nof_operands = len(self.operands)
+            variable_inst.result_id._add_use(self, nof_operands - 2)
+            parent_inst.result_id._add_use(self, nof_operands - 1)
 
     def remove_from_phi(self, parent_id):
         """Remove a parent (and corresponding variable) from a phi-node."""
         assert self.op_name == 'OpPhi'
+        _mark_modified(self)
         idx = self.operands.index(parent_id)
-        variable_id = self.operands[idx - 1]
+        # The following operands change slots, so all uses are re-added.
+        is_inserted = self.basic_block is not None
+        if is_inserted:
+            _remove_use_from_id(self)
         del self.operands[idx - 1 : idx + 1]
-        self.operands.append(variable_id)
-        variable_id.operand.uses.remove(self)
-        self.operands.append(parent_id)
-        parent_id.operand.uses.remove(self)
+        if is_inserted:
+            _add_use_to_id(self)
 
     def uses(self):
         """Return all instructions using this instruction.
@@ -810,17 +1386,13 @@ class Instruction(object):
         Debug and decoration instructions are not considered using
         any instruction."""
         if self.result_id is not None:
-            res = [inst for inst in self.result_id.uses
-                   if (inst.op_name not in DECORATION_INSTRUCTIONS and
-                       inst.op_name not in DEBUG_INSTRUCTIONS)]
-        else:
-            res = []
-        return res
+            return self.result_id._users()
+        return []
 
     def get_decorations(self):
         """Return all decorations for this instruction."""
         if self.result_id is not None:
-            res = [inst for inst in self.result_id.uses
+            res = [inst for inst in self.result_id._annotation_users()
                    if inst.op_name in DECORATION_INSTRUCTIONS]
             res.sort(key=lambda decoration_inst: decoration_inst.operands[1])
         else:
@@ -832,14 +1404,21 @@ class Instruction(object):
 
         Decoration and debug instructions are not updated, as they are
         considered being a part of the instruction they reference."""
-        for inst in self.uses():
-            _remove_use_from_id(inst)
-            if inst.type_id == self.result_id:
-                inst.type_id = new_inst.result_id
-            for idx, operand in enumerate(inst.operands):
-                if operand == self.result_id:
-                    inst.operands[idx] = new_inst.result_id
-            _add_use_to_id(inst)
+        old_id = self.result_id
+        new_id = new_inst.result_id
+        if old_id is None or new_id is old_id:
+            return
+        # Only the operand slots recorded for the uses are updated.
+        for inst, slots in old_id._pop_uses():
+            if type(slots) is not tuple:
+                slots = (slots,)
+            for slot in slots:
+                if slot < 0:
+                    inst.type_id = new_id
+                else:
+                    inst.operands[slot] = new_id
+                new_id._add_use(inst, slot)
+            _mark_modified(inst)
 
     def replace_with(self, new_inst):
         """Replace this instruction with new_inst.
@@ -873,6 +1452,24 @@ class Instruction(object):
         """True if the instruction is commutative."""
         return self.op_name in _IS_COMMUTATIVE
 
+    def structural_key(self):
+        """Return a hashable key representing the instruction's structure.
+
+        Two instructions have equal keys if they have the same op_name,
+        type_id, and operands (where the operands of commutative
+        instructions may be in any order), so the key can be used for
+        finding identical instructions. The result_id is not part of the
+        key. The IDs in the key are compared by identity, so keys are only
+        meaningful within one module.
+
+        The key is cached, and the cache is invalidated when the
+        instruction is modified through the API."""
+        key = self._structural_key
+        if key is None:
+            key = _inst_key(self.op_name, self.type_id, self.operands)
+            self._structural_key = key
+        return key
+
     def is_global_inst(self):
         """Return true if this is a global instruction, false otherwise."""
         if ((self.op_name in INITIAL_INSTRUCTIONS or
@@ -949,14 +1546,24 @@ class Instruction(object):
 
 
 class Id(object):
-    # Keep the counter in a list so that the object is mutable
-    # and can be updated/shared between different Id objects.
-    _temp_id_counter = [0]
+    # The instructions using the ID are stored in _uses, which is None
+    # if there are no uses, the instruction if there is one use, and a
+    # dict mapping the instructions to their operand slots if there are
+    # more uses (most IDs have only one use, and a dict is much larger
+    # than the Id object). The operand slots for the single use case are
+    # stored in _use_slots. The slots are the index of the operand (or -1
+    # for the type_id), or a tuple of indices if the instruction uses the
+    # ID in several operands.
+    #
+    # Decoration and debug instructions are not considered using the ID,
+    # and they are stored in _annotations (which is None, the instruction,
+    # or a set of instructions) without operand slots.
+    __slots__ = ['value', 'is_temp', 'inst', '_uses', '_use_slots',
+                 '_annotations']
 
     def __init__(self, module, value=None):
         if value is None:
-            self._temp_id_counter[0] += 1
-            self.value = self._temp_id_counter[0]
+            self.value = module._new_temp_id_value()
             self.is_temp = True
         else:
             assert 0 < value < 0xffffffff
@@ -964,13 +1571,143 @@ class Id(object):
             self.is_temp = False
             module.bound = max(module.bound, value + 1)
         self.inst = None
-        self.uses = set()
+        self._uses = None
+        self._use_slots = None
+        self._annotations = None
+
+    @property
+    def uses(self):
+        """A frozenset of the instructions using this ID.
+
+        This includes the decoration and debug instructions. The set is a
+        snapshot, so it is not affected by later changes to the IR."""
+        uses = self._uses
+        if uses is None:
+            uses = ()
+        elif type(uses) is not dict:
+            uses = (uses,)
+        annotations = self._annotations
+        if annotations is None:
+            return frozenset(uses)
+        if type(annotations) is not set:
+            annotations = (annotations,)
+        return frozenset(uses).union(annotations)
+
+    def has_uses(self):
+        """Return True if uses is not empty.
+
+        This is cheaper than testing uses, as the set is not created."""
+        return self._uses is not None or self._annotations is not None
+
+    def nof_uses(self):
+        """Return the number of instructions in uses."""
+        uses = self._uses
+        annotations = self._annotations
+        if uses is None:
+            nof_uses = 0
+        elif type(uses) is dict:
+            nof_uses = len(uses)
+        else:
+            nof_uses = 1
+        if annotations is None:
+            return nof_uses
+        elif type(annotations) is set:
+            return nof_uses + len(annotations)
+        return nof_uses + 1
+
+    def _users(self):
+        """Return a list of the instructions using this ID.
+
+        Decoration and debug instructions are not included."""
+        uses = self._uses
+        if uses is None:
+            return []
+        elif type(uses) is dict:
+            return list(uses)
+        return [uses]
+
+    def _annotation_users(self):
+        """Return a list of the decoration and debug instructions."""
+        annotations = self._annotations
+        if annotations is None:
+            return []
+        elif type(annotations) is set:
+            return list(annotations)
+        return [annotations]
+
+    def _pop_uses(self):
+        """Remove all uses, and return them as (inst, slots) pairs."""
+        uses = self._uses
+        self._uses = None
+        if uses is None:
+            return []
+        elif type(uses) is dict:
+            return list(uses.items())
+        slots = self._use_slots
+        self._use_slots = None
+        return [(uses, slots)]
+
+    def _add_use(self, inst, slot):
+        """Add the use of this ID in the operand slot of inst."""
+        uses = self._uses
+        if uses is None:
+            self._uses = inst
+            self._use_slots = slot
+        elif uses is inst:
+            self._use_slots = _add_slot(self._use_slots, slot)
+        elif type(uses) is dict:
+            slots = uses.get(inst)
+            uses[inst] = slot if slots is None else _add_slot(slots, slot)
+        else:
+            self._uses = {uses: self._use_slots, inst: slot}
+            self._use_slots = None
+
+    def _remove_use(self, inst):
+        """Remove all uses of this ID in inst.
+
+        KeyError is raised if inst is not using the ID."""
+        uses = self._uses
+        if type(uses) is dict:
+            del uses[inst]
+            if not uses:
+                self._uses = None
+        elif uses is inst:
+            self._uses = None
+            self._use_slots = None
+        else:
+            raise KeyError(inst)
+
+    def _add_annotation(self, inst):
+        """Add the decoration or debug instruction inst to this ID."""
+        annotations = self._annotations
+        if annotations is None:
+            self._annotations = inst
+        elif type(annotations) is set:
+            annotations.add(inst)
+        elif annotations is not inst:
+            self._annotations = set((annotations, inst))
+
+    def _remove_annotation(self, inst):
+        """Remove the decoration or debug instruction inst from this ID.
+
+        KeyError is raised if inst is not annotating the ID."""
+        annotations = self._annotations
+        if type(annotations) is set:
+            annotations.remove(inst)
+            if not annotations:
+                self._annotations = None
+        elif annotations is inst:
+            self._annotations = None
+        else:
+            raise KeyError(inst)
 
     def destroy(self):
         """Destroy the ID."""
         self.is_temp = False
         self.inst = None
-        self.uses = None
+        self._uses = None
+        self._use_slots = None
+        self._annotations = None
         # Change the value to be out of range so that it will be caught
         # if the ID escapes and is written to a binary, and so that the
         # original value can be retrieved by subtracting 0x200000000, which
@@ -983,32 +1720,74 @@ class Id(object):
         else:
             return '%' + str(self.value)
 
-    def __hash__(self):
-        return id(self)
+    # The IDs are compared and hashed by identity, using the default
+    # object methods (which is much faster than defining them in Python,
+    # as IDs are used as keys in dictionaries everywhere).
 
-    def __eq__(self, other):
-        return other is self
 
-    def __ne__(self, other):
-        return not self.__eq__(other)
+def _mark_modified(inst):
+    """Mark inst, and the function or global section containing it, as
+    modified."""
+    inst._structural_key = None
+    if inst.function is not None:
+        inst.function.source_range = None
+    elif isinstance(inst.basic_block, _GlobalInstructions):
+        inst.basic_block._inst_modified(inst)
+
+
+def _inst_key(op_name, type_id, operands):
+    """Return the structural key for an instruction.
+
+    The operands are converted to a tuple (where the mask lists are
+    converted to tuples) so that the key is hashable. The operands of
+    commutative instructions are placed in a canonical order."""
+    operands = tuple(tuple(operand) if isinstance(operand, list) else operand
+                     for operand in operands)
+    if (op_name in _IS_COMMUTATIVE and len(operands) == 2 and
+            id(operands[0]) > id(operands[1])):
+        operands = (operands[1], operands[0])
+    return (op_name, type_id, operands)
+
+
+def _add_slot(slots, slot):
+    """Add slot to the operand slots (an int or a tuple of ints)."""
+    if type(slots) is tuple:
+        return slots if slot in slots else slots + (slot,)
+    return slots if slots == slot else (slots, slot)
 
 
 def _add_use_to_id(inst):
+    if inst.op_name in _ANNOTATION_INSTRUCTIONS:
+        for operand in inst.operands:
+            if isinstance(operand, Id):
+                operand._add_annotation(inst)
+        return
     if inst.type_id is not None:
-        inst.type_id.uses.add(inst)
-    for operand in inst.operands:
+        inst.type_id._add_use(inst, -1)
+    for idx, operand in enumerate(inst.operands):
         if isinstance(operand, Id):
-            operand.uses.add(inst)
+            operand._add_use(inst, idx)
 
 
 def _remove_use_from_id(inst):
+    if inst.op_name in _ANNOTATION_INSTRUCTIONS:
+        for operand in inst.operands:
+            if isinstance(operand, Id):
+                try:
+                    operand._remove_annotation(inst)
+                except KeyError:
+                    # The ID is used by several operands.
+                    pass
+        return
     if inst.type_id is not None:
-        assert inst in inst.type_id.uses
-        inst.type_id.uses.remove(inst)
+        inst.type_id._remove_use(inst)
     for operand in inst.operands:
         if isinstance(operand, Id):
-            if inst in operand.uses:
-                operand.uses.remove(inst)
+            try:
+                operand._remove_use(inst)
+            except KeyError:
+                # The ID is used by several operands.
+                pass
 
 
 def float_to_bits(bitwidth, value):
@@ -1031,6 +1810,11 @@ def bits_to_float(bitwidth, value):
         return struct.unpack('=d', struct.pack('=Q', value))[0]
 
 
+_SNAPSHOT_ID = 0
+_SNAPSHOT_INT = 1
+_SNAPSHOT_STRING = 2
+_SNAPSHOT_OBJECT = 3
+
 MAGIC = 0x07230203
 GENERATOR_MAGIC = 0
 VERSION = 0x00010000
@@ -1080,6 +1864,10 @@ DECORATION_INSTRUCTIONS = set([
     'OpDecorationGroup'
 ])
 
+# The instructions that are not considered using the IDs they reference.
+_ANNOTATION_INSTRUCTIONS = frozenset(DEBUG_INSTRUCTIONS |
+                                     DECORATION_INSTRUCTIONS)
+
 TYPE_DECLARATION_INSTRUCTIONS = set([
     'OpTypeVoid',
     'OpTypeBool',
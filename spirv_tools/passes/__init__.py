@@ -1,20 +1,74 @@
+from spirv_tools.passes import constprop
 from spirv_tools.passes import dead_inst_elim
 from spirv_tools.passes import dead_func_elim
 from spirv_tools.passes import instcombine
 from spirv_tools.passes import mem2reg
 from spirv_tools.passes import simplify_cfg
+from spirv_tools.passes.pass_manager import PassManager
+from spirv_tools.passes.statistics import PassStatistics
 
-def optimize(module):
+# The passes that can be used in pipelines, indexed by name.
+PASSES = {
+    'constprop': constprop,
+    'dead_func_elim': dead_func_elim,
+    'dead_inst_elim': dead_inst_elim,
+    'instcombine': instcombine,
+    'mem2reg': mem2reg,
+    'simplify_cfg': simplify_cfg,
+}
+
+# The pipeline run (to a fixed point) by optimize.
+OPTIMIZE_PIPELINE = [
+    'instcombine',
+    'simplify_cfg',
+    'dead_inst_elim',
+    'dead_func_elim',
+    'mem2reg',
+]
+
+# The maximal number of times optimize runs each pass.
+OPTIMIZE_MAX_ITERATIONS = 10
+
+
+def get_pipeline(pass_names):
+    """Return the pass modules for a pipeline.
+
+    The pass_names is a list of pass names, or a string with the names
+    separated by commas (such as 'mem2reg,instcombine')."""
+    if isinstance(pass_names, str):
+        pass_names = [name.strip() for name in pass_names.split(',')
+                      if name.strip()]
+    pipeline = []
+    for name in pass_names:
+        if name not in PASSES:
+            raise ValueError('Unknown pass ' + name)
+        pipeline.append(PASSES[name])
+    return pipeline
+
+
+def run_pipeline(module, pass_names, processes=1, statistics=None):
+    """Run the passes named in pass_names (see get_pipeline) on module.
+
+    The functions are processed in processes worker processes if
+    processes is larger than 1, and the pass runs are recorded in the
+    PassStatistics statistics if it is not None."""
+    PassManager(module, processes, statistics).run(get_pipeline(pass_names))
+
+
+def optimize(module, processes=1, statistics=None):
     """Do basic optimizations.
 
     This only runs optimization passes that are likely to be profitable
-    on all architectures (such as removing dead code)."""
-    instcombine.run(module)
-    simplify_cfg.run(module)
-    dead_inst_elim.run(module)
-    dead_func_elim.run(module)
-    mem2reg.run(module)
-    instcombine.run(module)
-    simplify_cfg.run(module)
-    dead_inst_elim.run(module)
-    dead_func_elim.run(module)
+    on all architectures (such as removing dead code). The passes are
+    rerun on the changed functions until the module does not change.
+    The functions are processed in processes worker processes if
+    processes is larger than 1, and the pass runs are recorded in the
+    PassStatistics statistics if it is not None.
+
+    A dictionary mapping each pass name to the number of times the pass
+    was run is returned."""
+    manager = PassManager(module, processes, statistics)
+    iteration_counts = manager.run_to_fixed_point(
+        get_pipeline(OPTIMIZE_PIPELINE), OPTIMIZE_MAX_ITERATIONS)
+    return dict((name, iteration_counts[PASSES[name]])
+                for name in OPTIMIZE_PIPELINE)
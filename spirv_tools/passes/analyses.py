@@ -0,0 +1,112 @@
+"""Analyses used by the optimization passes.
+
+The function analyses take a function as argument, and the module analyses
+take the module. The passes get the results through a PassManager, which
+caches them until a pass invalidates them (see pass_manager.py)."""
+import collections
+
+
+def predecessors(function):
+    """Return a dictionary with predecessors for each basic block.
+
+    The dictionary is a defaultdict, so basic blocks without predecessors
+    map to an empty list."""
+    pred = collections.defaultdict(list)
+    for basic_block in function.basic_blocks:
+        for successor in basic_block.get_successors():
+            if basic_block not in pred[successor]:
+                pred[successor].append(basic_block)
+    return pred
+
+
+def reachable_blocks(function):
+    """Return the set of basic blocks reachable from the entry block."""
+    entry_block = function.basic_blocks[0]
+    reachable = set([entry_block])
+    worklist = [entry_block]
+    while worklist:
+        basic_block = worklist.pop()
+        for successor in basic_block.get_successors():
+            if successor not in reachable:
+                reachable.add(successor)
+                worklist.append(successor)
+    return reachable
+
+
+def _reverse_postorder(entry_block):
+    """Return the reachable basic blocks in reverse postorder."""
+    postorder = []
+    visited = set([entry_block])
+    stack = [(entry_block, iter(entry_block.get_successors()))]
+    while stack:
+        basic_block, successors = stack[-1]
+        for successor in successors:
+            if successor not in visited:
+                visited.add(successor)
+                stack.append((successor, iter(successor.get_successors())))
+                break
+        else:
+            stack.pop()
+            postorder.append(basic_block)
+    postorder.reverse()
+    return postorder
+
+
+def dominators(function):
+    """Return a dictionary with the immediate dominator of each basic block.
+
+    The entry block maps to None, and unreachable basic blocks are not
+    included in the dictionary.
+
+    This uses the algorithm from Cooper, Harvey, and Kennedy, "A Simple,
+    Fast Dominance Algorithm"."""
+    entry_block = function.basic_blocks[0]
+    order = _reverse_postorder(entry_block)
+    rpo_number = dict((basic_block, idx)
+                      for idx, basic_block in enumerate(order))
+    pred = predecessors(function)
+    idom = {entry_block: entry_block}
+    changed = True
+    while changed:
+        changed = False
+        for basic_block in order[1:]:
+            new_idom = None
+            for pred_block in pred[basic_block]:
+                if pred_block not in idom:
+                    continue
+                if new_idom is None:
+                    new_idom = pred_block
+                    continue
+                # Find the nearest common dominator.
+                finger1 = pred_block
+                finger2 = new_idom
+                while finger1 is not finger2:
+                    while rpo_number[finger1] > rpo_number[finger2]:
+                        finger1 = idom[finger1]
+                    while rpo_number[finger2] > rpo_number[finger1]:
+                        finger2 = idom[finger2]
+                new_idom = finger1
+            if idom.get(basic_block) is not new_idom:
+                idom[basic_block] = new_idom
+                changed = True
+    idom[entry_block] = None
+    return idom
+
+
+def call_graph(module):
+    """Return a dictionary mapping each function to the functions it calls.
+
+    The called functions are listed in the order of their first call."""
+    id_to_func = {}
+    for function in module.functions:
+        id_to_func[function.inst.result_id] = function
+    graph = {}
+    for function in module.functions:
+        called_funcs = []
+        for inst in function.instructions():
+            if inst.op_name == 'OpFunctionCall':
+                called_func = id_to_func[inst.operands[0]]
+                if called_func not in called_funcs:
+                    called_funcs.append(called_func)
+        graph[function] = called_funcs
+    return graph
@@ -3,6 +3,11 @@
 This pass tends to leave dead instructions, so dead_inst_elim should
 be run after."""
 from spirv_tools import ir
+from spirv_tools.passes import pass_manager as pm
+
+# The pass does not change the CFG or the function calls.
+PRESERVED_ANALYSES = frozenset(['call_graph', 'dominators', 'predecessors',
+                                'reachable'])
 
 
 def transform_1op_componentwise(module, transform, type_id, const_inst):
@@ -60,11 +65,6 @@ def get_or_create_const_composite(module, type_id, operands):
 
     An existing instruction is returned, or a new one is created if there
     is no such instruction already."""
-    for inst in module.global_instructions.type_insts:
-        if (inst.op_name == 'OpConstantComposite' and
-                inst.type_id == type_id and
-                inst.operands == operands):
-            return inst
     return module.get_global_inst('OpConstantComposite', type_id, operands[:])
 
 
@@ -176,10 +176,26 @@ def optimize_inst(module, inst):
     return inst
 
 
-def run(module):
+def process_function(module, function, pass_manager=None):
+    """Run the pass on one function.
+
+    Return True if the function was changed."""
+    changed = False
+    for inst in function.instructions():
+        # Dead instructions are left for dead_inst_elim.
+        if not inst.uses():
+            continue
+        optimized_inst = optimize_inst(module, inst)
+        if optimized_inst != inst:
+            inst.replace_uses_with(optimized_inst)
+            changed = True
+    return changed
+
+
+def run(module, pass_manager=None, functions=None):
     """Simple constant propagation and merging"""
-    for function in module.functions:
-        for inst in function.instructions():
-            optimized_inst = optimize_inst(module, inst)
-            if optimized_inst != inst:
-                inst.replace_uses_with(optimized_inst)
+    changed_functions = set()
+    for function in pm.get_functions(module, functions):
+        if process_function(module, function, pass_manager):
+            changed_functions.add(function)
+    return pm.make_result(False, changed_functions)
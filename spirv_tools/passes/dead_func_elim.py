@@ -1,28 +1,37 @@
 """Removes unused functions."""
+from spirv_tools.passes import analyses
+from spirv_tools.passes import pass_manager as pm
 
+# The remaining functions are not changed.
+PRESERVED_ANALYSES = frozenset(['dominators', 'predecessors', 'reachable'])
 
-def reachable(func, reachable_funcs, id_to_func):
-    """Recursively mark functions reachable from func."""
-    reachable_funcs.add(func)
-    for inst in func.instructions():
-        if inst.op_name == 'OpFunctionCall':
-            called_func = id_to_func[inst.operands[0]]
-            if called_func not in reachable_funcs:
-                reachable(called_func, reachable_funcs, id_to_func)
+# The pass processes the set of functions, so the functions argument to
+# run is ignored.
+MODULE_PASS = True
 
 
-def run(module):
+def run(module, pass_manager=None, functions=None):
     """Remove all unused functions."""
+    if pass_manager is None:
+        call_graph = analyses.call_graph(module)
+    else:
+        call_graph = pass_manager.get_analysis('call_graph')
     id_to_func = {}
     for func in module.functions:
         id_to_func[func.inst.result_id] = func
 
     reachable_funcs = set()
-    for inst in module.global_instructions.op_entry_point_insts:
-        reachable(id_to_func[inst.operands[1]],
-                  reachable_funcs,
-                  id_to_func)
+    worklist = [id_to_func[inst.operands[1]]
+                for inst in module.global_instructions.op_entry_point_insts]
+    while worklist:
+        func = worklist.pop()
+        if func not in reachable_funcs:
+            reachable_funcs.add(func)
+            worklist.extend(call_graph[func])
 
+    module_changed = False
     for func in module.functions[:]:
         if func not in reachable_funcs:
             func.destroy()
+            module_changed = True
+    return pm.make_result(module_changed, ())
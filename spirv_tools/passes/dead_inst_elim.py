@@ -4,26 +4,46 @@ The definition of "unused instruction" is an instruction having a return
 ID that is not used by any non-debug and non-decoration instruction, and
 does not have side effects."""
 from spirv_tools import ir
+from spirv_tools.passes import pass_manager as pm
+
+# Branches and function calls have side effects, so the pass does not
+# change the CFG or the function calls.
+PRESERVED_ANALYSES = frozenset(['call_graph', 'dominators', 'predecessors',
+                                'reachable'])
+
+# The pass removes the unused global instructions.
+MODULE_PASS = True
 
 
 def remove_debug_if_dead(inst):
-    """Remove debug instruction if it is not used."""
+    """Remove debug instruction if it is not used.
+
+    Return True if the instruction was removed."""
     assert inst.op_name in ir.DEBUG_INSTRUCTIONS
     if inst.op_name == 'OpName':
         if inst.operands[0].inst is None:
             inst.destroy()
+            return True
+    return False
 
 
 def remove_decoration_if_dead(inst):
-    """Remove decoration instruction if it is not used."""
+    """Remove decoration instruction if it is not used.
+
+    Return True if the instruction was removed."""
     assert inst.op_name in ir.DECORATION_INSTRUCTIONS
     if inst.op_name != 'OpDecorationGroup':
         if inst.operands[0].inst is None:
             inst.destroy()
+            return True
+    return False
+
 
+def process_function(module, function, pass_manager=None):
+    """Run the pass on one function.
 
-def process_function(module, function):
-    """Run the pass on one function."""
+    Return True if the function was changed."""
+    changed = False
     # We need to re-run the pass if elimination of a phi-node makes
     # instructions dead in an already processed basic block.
     rerun = True
@@ -34,6 +54,7 @@ def process_function(module, function):
             if inst.op_name == 'OpLabel':
                 processed_bbs.add(inst.basic_block)
             if not inst.has_side_effects() and not inst.uses():
+                changed = True
                 if inst.op_name == 'OpPhi':
                     processed_bbs.add(inst.basic_block)
                     operands = inst.operands[:]
@@ -46,11 +67,20 @@ def process_function(module, function):
                             break
                 else:
                     inst.destroy()
+    return changed
 
 
-def run(module):
+def run(module, pass_manager=None, functions=None):
     """Remove all unused instructions."""
 
+    # The IDs defined in, and the uses in, lazily loaded function bodies
+    # are only known when the bodies are decoded, so all bodies are decoded
+    # before looking at the global instructions. Otherwise, the names of
+    # IDs defined in the bodies, and the global instructions used only by
+    # functions not in functions, would look unused.
+    for function in module.functions:
+        function.basic_blocks
+
     # Garbage collect old unused debug and decoration instructions.
     # This is done before the real pass because:
     # * They need some special handling, as they do not have inst.result_id
@@ -60,18 +90,24 @@ def run(module):
     # Note: the debug and decoration instructions that are live at the start
     # of this pass is handled by the real pass when the instruction they
     # point to is removed.
+    module_changed = False
     for inst in module.global_instructions.name_insts:
-        remove_debug_if_dead(inst)
+        module_changed |= remove_debug_if_dead(inst)
     for inst in module.global_instructions.op_string_insts:
-        remove_debug_if_dead(inst)
+        module_changed |= remove_debug_if_dead(inst)
     for inst in reversed(module.global_instructions.decoration_insts):
-        remove_decoration_if_dead(inst)
+        module_changed |= remove_decoration_if_dead(inst)
 
     # Remove unused instructions in functions.
-    for function in module.functions:
-        process_function(module, function)
+    changed_functions = set()
+    for function in pm.get_functions(module, functions):
+        if process_function(module, function, pass_manager):
+            changed_functions.add(function)
 
     # Remove unused global instructions.
     for inst in module.global_instructions.instructions_reversed():
         if not inst.has_side_effects() and not inst.uses():
             inst.destroy()
+            module_changed = True
+
+    return pm.make_result(module_changed, changed_functions)
@@ -1,9 +1,18 @@
 """Combine/simplify instructions, to fewer/simpler instructions
 
-This pass tends to leave dead instructions, so dead_inst_elim should
-be run after."""
+The instructions are processed from a worklist, where the users of a
+simplified instruction are added back to the worklist, so the result
+does not improve by rerunning the pass. The instructions made dead by the
+simplifications are removed, but the pass may still leave dead
+instructions (such as intermediate instructions created when simplifying),
+so dead_inst_elim should be run after."""
 from spirv_tools import ir
 from spirv_tools.passes import constprop
+from spirv_tools.passes import pass_manager as pm
+
+# The pass does not change the CFG or the function calls.
+PRESERVED_ANALYSES = frozenset(['call_graph', 'dominators', 'predecessors',
+                                'reachable'])
 
 
 def optimize_OpBitcast(module, inst):
@@ -360,7 +369,11 @@ def canonicalize_inst(module, inst):
         assert extset_inst.op_name == 'OpExtInstImport'
         if extset_inst.operands[0] in ir.EXT_INST:
             ext_ops = ir.EXT_INST[extset_inst.operands[0]]
-            if ext_ops[inst.operands[1]]['is_commutative']:
+            if (ext_ops[inst.operands[1]]['is_commutative'] and
+                    inst.operands[2].inst.op_name in
+                    ir.CONSTANT_INSTRUCTIONS and
+                    inst.operands[3].inst.op_name not in
+                    ir.CONSTANT_INSTRUCTIONS):
                 new_inst = ir.Instruction(module, 'OpExtInst', inst.type_id,
                                           [inst.operands[0], inst.operands[1],
                                            inst.operands[3], inst.operands[2]])
@@ -399,15 +412,72 @@ def optimize_inst(module, inst):
     return inst
 
 
-def process_function(module, function):
-    """Run the pass on one function."""
-    for inst in function.instructions():
+def erase_if_dead(inst, function):
+    """Destroy inst, and the operands it made dead, if inst is dead.
+
+    Only instructions in the basic blocks of function are destroyed."""
+    worklist = [inst]
+    while worklist:
+        inst = worklist.pop()
+        if (inst.op_name is None or inst.function is not function or
+                inst.basic_block is None or inst.op_name == 'OpLabel' or
+                inst.has_side_effects() or inst.uses()):
+            continue
+        operands = [inst.type_id] + inst.operands
+        inst.destroy()
+        for operand in operands:
+            if isinstance(operand, ir.Id) and operand.inst is not None:
+                worklist.append(operand.inst)
+
+
+def process_function(module, function, pass_manager=None):
+    """Run the pass on one function.
+
+    Return True if the function was changed."""
+    changed = False
+    # The worklist is used as a stack, so it is initialized in reverse
+    # order to process the instructions in the order they are in the
+    # function. The instructions in the worklist are also in queued.
+    worklist = list(function.instructions_reversed())
+    queued = set(worklist)
+    while worklist:
+        inst = worklist.pop()
+        queued.discard(inst)
+        # Dead instructions are left for dead_inst_elim (and instructions
+        # destroyed while in the worklist have op_name None).
+        if inst.op_name is None:
+            continue
+        users = inst.uses()
+        if not users:
+            continue
         optimized_inst = optimize_inst(module, inst)
         if optimized_inst != inst:
             inst.replace_uses_with(optimized_inst)
-
-
-def run(module):
+            changed = True
+            # The users, the optimized instruction, and the instructions
+            # it uses (which may have been created when optimizing) may
+            # now be possible to simplify. The optimized instruction is
+            # pushed last, so that it is processed first.
+            to_push = list(users)
+            if optimized_inst.function is function:
+                for operand in optimized_inst.operands:
+                    if (isinstance(operand, ir.Id) and
+                            operand.inst is not None and
+                            operand.inst.function is function):
+                        to_push.append(operand.inst)
+                to_push.append(optimized_inst)
+            for push_inst in to_push:
+                if push_inst not in queued:
+                    worklist.append(push_inst)
+                    queued.add(push_inst)
+            erase_if_dead(inst, function)
+    return changed
+
+
+def run(module, pass_manager=None, functions=None):
     """Combine/simplify instructions, to fewer/simpler instructions"""
-    for function in module.functions:
-        process_function(module, function)
+    changed_functions = set()
+    for function in pm.get_functions(module, functions):
+        if process_function(module, function, pass_manager):
+            changed_functions.add(function)
+    return pm.make_result(False, changed_functions)
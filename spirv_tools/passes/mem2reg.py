@@ -8,39 +8,36 @@ and promotes the loads and stores as it iterates through the function.
 
 This pass tends to leave dead OpPhi instructions, so dead_inst_elim should
 be run after."""
-import collections
-
 from spirv_tools import ir
+from spirv_tools.passes import analyses
+from spirv_tools.passes import pass_manager as pm
 
+# The pass does not change the CFG.
+PRESERVED_ANALYSES = frozenset(['call_graph', 'dominators', 'predecessors',
+                                'reachable'])
 
-def calculate_pred(func):
-    """Return a dictionary with predecessors for each basic block."""
-    pred = collections.defaultdict(list)
-    for basic_block in func.basic_blocks:
-        for successor in basic_block.get_successors():
-            if basic_block not in pred[successor]:
-                pred[successor].append(basic_block)
-    return pred
 
+def optimize_variable(module, func, var_inst, pred):
+    """Promote/eliminate the var_inst variable if possible.
 
-def optimize_variable(module, func, var_inst):
-    """Promote/eliminate the var_inst variable if possible."""
+    The pred is the predecessors analysis for func. Return True if the
+    variable was promoted/eliminated."""
     # Delete variable if it is not used.
-    if not var_inst.result_id.uses:
+    if not var_inst.result_id.has_uses():
         var_inst.destroy()
-        return
+        return True
 
     # We only handle simple loads and stores.
     for inst in var_inst.uses():
         if inst.op_name not in ['OpLoad', 'OpStore']:
-            return
+            return False
 
     # Eliminate loads/store instructions for the variable
-    pred = calculate_pred(func)
     exit_value = {}
     phi_nodes = []
     undef_insts = []
     var_type_id = var_inst.type_id.inst.operands[1]
+    var_uses = var_inst.result_id.uses
     for basic_block in func.basic_blocks:
         # Get the variable's value at start of the basic block.
         if not pred[basic_block]:
@@ -54,7 +51,7 @@ def optimize_variable(module, func, var_inst):
 
         # Eliminate loads/store instructions.
         ordered_uses = [inst for inst in basic_block.insts
-                        if inst in var_inst.result_id.uses]
+                        if inst in var_uses]
         for inst in ordered_uses:
             if inst.op_name == 'OpLoad':
                 if stored_inst is None:
@@ -89,25 +86,41 @@ def optimize_variable(module, func, var_inst):
 
     # Destroy obviously dead instructions.
     for inst in reversed(phi_nodes):
-        if not inst.result_id.uses:
+        if not inst.result_id.has_uses():
             inst.destroy()
     for inst in undef_insts:
-        if not inst.result_id.uses:
+        if not inst.result_id.has_uses():
             inst.destroy()
     var_inst.destroy()
+    return True
+
 
+def process_function(module, function, pass_manager=None):
+    """Run the pass on one function.
 
-def process_function(module, function):
-    """Run the pass on one function."""
+    Return True if the function was changed."""
+    changed = False
+    pred = None
     for inst in function.basic_blocks[0].insts[:]:
         # The variables must be defined at the top of the basic block,
         # i.e. we are done when we find the first non-OpVariable inst.
         if inst.op_name != 'OpVariable':
             break
-        optimize_variable(module, function, inst)
-
-
-def run(module):
+        if pred is None:
+            # The CFG is not changed by the pass, so the predecessors are
+            # shared by all variables.
+            if pass_manager is None:
+                pred = analyses.predecessors(function)
+            else:
+                pred = pass_manager.get_analysis('predecessors', function)
+        changed |= optimize_variable(module, function, inst, pred)
+    return changed
+
+
+def run(module, pass_manager=None, functions=None):
     """Change OpVariable (of Function storage class) to registers."""
-    for function in module.functions:
-        process_function(module, function)
+    changed_functions = set()
+    for function in pm.get_functions(module, functions):
+        if process_function(module, function, pass_manager):
+            changed_functions.add(function)
+    return pm.make_result(False, changed_functions)
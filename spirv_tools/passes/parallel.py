@@ -0,0 +1,434 @@
+"""Run a pass on the functions in parallel worker processes.
+
+The worker processes are forked from the process running the pass
+manager, so they get their own copy of the module. Each worker runs the
+pass's process_function(module, function, pass_manager) on its share of
+the functions, and returns the changed function bodies and the global
+instructions it created (such as constants created when folding) in a
+picklable form. The results are merged back into the module in the order
+the functions are in the module, where the created types and constants
+are looked up by get_global_inst. The result is therefore the same as when
+the pass is run on one function at a time, independent of the number of
+processes and how the functions are distributed over them.
+
+The IDs are passed between the processes as their value, where temporary
+IDs are negated. The IDs that did not exist when the workers were forked
+are only unique within the worker process that created them."""
+import multiprocessing
+import os
+
+from spirv_tools import ir
+from spirv_tools.passes import pass_manager as pm
+
+
+# The state the workers are forked with: (module, pass manager, pass
+# module, list of functions to process, PassStatistics or None).
+_state = None
+
+# Per-worker data: the (section index, instruction index) of the global
+# instructions that existed when the worker was forked, and the numbers of
+# the global instructions the worker has created.
+_worker_data = None
+
+
+def _id_ref(id_obj):
+    """Return the value identifying id_obj in the results."""
+    if id_obj is None:
+        return None
+    return -id_obj.value if id_obj.is_temp else id_obj.value
+
+
+def _encode_inst(inst):
+    """Return a picklable description of inst."""
+    operands = []
+    id_indices = []
+    for idx, operand in enumerate(inst.operands):
+        if isinstance(operand, ir.Id):
+            operand = _id_ref(operand)
+            id_indices.append(idx)
+        operands.append(operand)
+    return (inst.op_name, _id_ref(inst.type_id), _id_ref(inst.result_id),
+            operands, id_indices)
+
+
+def _encode_body(function, old_blocks, old_insts):
+    """Return a picklable description of the basic blocks in function.
+
+    The old_blocks and old_insts map the basic blocks and instructions the
+    function had before the pass was run to their indices (where the
+    instructions are numbered over the whole function) and state.
+
+    An unchanged basic block is described by its index. A changed basic
+    block is described as (old index, label ID, items), where the old index
+    is None for new basic blocks, and the items are the instructions, where
+    runs of unchanged instructions are described as a range of indices."""
+    basic_blocks = []
+    for basic_block in function.basic_blocks:
+        items = []
+        for inst in basic_block.insts:
+            old_state = old_insts.get(inst)
+            if (old_state is not None and
+                    old_state[1:] == (inst.op_name, inst.type_id,
+                                      inst.result_id, inst.operands)):
+                inst_idx = old_state[0]
+                if (items and isinstance(items[-1], range) and
+                        items[-1].stop == inst_idx):
+                    items[-1] = range(items[-1].start, inst_idx + 1)
+                else:
+                    items.append(range(inst_idx, inst_idx + 1))
+            else:
+                items.append(_encode_inst(inst))
+        if basic_block in old_blocks:
+            block_idx, start, end = old_blocks[basic_block]
+            if items == [range(start, end)] or (not items and start == end):
+                basic_blocks.append(block_idx)
+                continue
+        else:
+            block_idx = None
+        basic_blocks.append((block_idx, _id_ref(basic_block.inst.result_id),
+                             items))
+    return basic_blocks
+
+
+def _process_function(idx):
+    """Run the pass on function idx in a worker process.
+
+    Return (process ID, function index, global instructions, basic blocks,
+    statistics), where the basic blocks are None if the function was not
+    changed (see _encode_body for the format), and statistics is None if
+    no statistics are recorded, and otherwise the number of instructions
+    created and destroyed and the number of IDs allocated by the pass."""
+    global _worker_data
+    module, pass_manager, pass_module, functions, statistics = _state
+    global_insts = module.global_instructions
+    if _worker_data is None:
+        old_positions = {}
+        for section_idx, insts_list in enumerate(global_insts.sections()):
+            for inst_idx, inst in enumerate(insts_list):
+                old_positions[inst] = (section_idx, inst_idx)
+        _worker_data = (old_positions, {})
+    old_positions, created = _worker_data
+
+    function = functions[idx]
+    old_blocks = {}
+    old_insts = {}
+    for basic_block in function.basic_blocks:
+        start = len(old_insts)
+        for inst in basic_block.insts[:]:
+            old_insts[inst] = (len(old_insts), inst.op_name, inst.type_id,
+                               inst.result_id, inst.operands[:])
+        old_blocks[basic_block] = (len(old_blocks), start, len(old_insts))
+    marker = global_insts.get_marker()
+    # The statistics are not recorded in the parent process when merging,
+    # so the worker's module must record them while running the pass.
+    module._statistics = statistics
+    if statistics is not None:
+        counts = (statistics.insts_created, statistics.insts_destroyed,
+                  statistics.ids_allocated)
+    changed = pass_module.process_function(module, function, pass_manager)
+    if statistics is not None:
+        counts = (statistics.insts_created - counts[0],
+                  statistics.insts_destroyed - counts[1],
+                  statistics.ids_allocated - counts[2])
+    else:
+        counts = None
+
+    new_globals = []
+    for inst, prev_inst in global_insts.inserted_since(marker):
+        if prev_inst is None:
+            anchor = None
+        elif prev_inst in created:
+            anchor = ('new', created[prev_inst])
+        else:
+            anchor = ('old', old_positions[prev_inst])
+        created[inst] = len(created)
+        new_globals.append((_encode_inst(inst), anchor))
+
+    basic_blocks = None
+    if changed:
+        basic_blocks = _encode_body(function, old_blocks, old_insts)
+    return os.getpid(), idx, new_globals, basic_blocks, counts
+
+
+class _Merger(object):
+    """Merges the results from the workers into the module."""
+    def __init__(self, module):
+        self.module = module
+        self.old_sections = [insts_list[:] for insts_list in
+                             module.global_instructions.sections()]
+        # The IDs that existed when the workers were forked, indexed by
+        # their reference value. The IDs defined in the function bodies
+        # are added when the function is merged.
+        self.old_ids = {}
+        for inst in module.global_instructions.instructions():
+            self._add_old_id(inst.result_id)
+        for function in module.functions:
+            self._add_old_id(function.inst.result_id)
+            for inst in function.parameters:
+                self._add_old_id(inst.result_id)
+        # The IDs and global instructions created by each worker, indexed
+        # by the worker's process ID.
+        self.new_ids = {}
+        self.new_globals = {}
+
+    def _add_old_id(self, id_obj):
+        if id_obj is not None:
+            self.old_ids[_id_ref(id_obj)] = id_obj
+
+    def _get_id(self, worker, ref):
+        """Return the Id for the reference ref from worker."""
+        if ref is None:
+            return None
+        id_obj = self.old_ids.get(ref)
+        if id_obj is None:
+            new_ids = self.new_ids.setdefault(worker, {})
+            id_obj = new_ids.get(ref)
+            if id_obj is None:
+                id_obj = ir.Id(self.module)
+                new_ids[ref] = id_obj
+        return id_obj
+
+    def _decode_operands(self, worker, encoded_inst):
+        """Return the operands of the instruction encoded_inst."""
+        _, _, _, operands, id_indices = encoded_inst
+        operands = operands[:]
+        for idx in id_indices:
+            operands[idx] = self._get_id(worker, operands[idx])
+        return operands
+
+    def _decode_inst(self, worker, encoded_inst):
+        """Create the instruction encoded_inst from worker."""
+        op_name, type_ref, result_ref, _, _ = encoded_inst
+        return ir.Instruction(self.module, op_name,
+                              self._get_id(worker, type_ref),
+                              self._decode_operands(worker, encoded_inst),
+                              result_id=self._get_id(worker, result_ref))
+
+    def merge(self, worker, function, new_globals, basic_blocks):
+        """Merge the result for function from worker.
+
+        Return True if the function was changed."""
+        global_insts = self.module.global_instructions
+        created = self.new_globals.setdefault(worker, [])
+
+        # The types and constants are looked up (or created) by
+        # get_global_inst, as they may have been created when merging the
+        # result for an earlier function.
+        annotations = []
+        for encoded_inst, anchor in new_globals:
+            op_name, type_ref, result_ref, _, _ = encoded_inst
+            if (op_name in ir.DEBUG_INSTRUCTIONS or
+                    op_name in ir.DECORATION_INSTRUCTIONS):
+                annotations.append((len(created), encoded_inst, anchor))
+                created.append(None)
+                continue
+            inst = self.module.get_global_inst(
+                op_name, self._get_id(worker, type_ref),
+                self._decode_operands(worker, encoded_inst))
+            self.new_ids.setdefault(worker, {})[result_ref] = inst.result_id
+            created.append(inst)
+
+        if basic_blocks is not None:
+            self._replace_body(worker, function, basic_blocks)
+
+        # The debug and decoration instructions are inserted at the same
+        # position as in the worker, as they may reference the IDs in the
+        # new function body.
+        for number, encoded_inst, anchor in annotations:
+            inst = self._decode_inst(worker, encoded_inst)
+            if anchor is None:
+                global_insts.prepend_inst(inst)
+            else:
+                kind, position = anchor
+                if kind == 'new':
+                    prev_inst = created[position]
+                else:
+                    section_idx, inst_idx = position
+                    prev_inst = self.old_sections[section_idx][inst_idx]
+                global_insts.insert_inst_after(inst, prev_inst)
+            created[number] = inst
+
+        return basic_blocks is not None
+
+    def _replace_body(self, worker, function, basic_blocks):
+        """Replace the basic blocks in function with basic_blocks.
+
+        The unchanged basic blocks and instructions are reused, and the
+        changed basic blocks are updated in place, so the time is mostly
+        proportional to the size of the change."""
+        old_blocks = function.basic_blocks[:]
+        old_insts = []
+        inst_starts = []
+        for basic_block in old_blocks:
+            inst_starts.append(len(old_insts))
+            self._add_old_id(basic_block.inst.result_id)
+            for inst in basic_block.insts[:]:
+                old_insts.append(inst)
+                self._add_old_id(inst.result_id)
+        inst_starts.append(len(old_insts))
+
+        # Find the reused basic blocks and instructions, and the result IDs
+        # of the new instructions.
+        kept_blocks = set()
+        kept_insts = bytearray(len(old_insts))
+        new_result_refs = set()
+        for block in basic_blocks:
+            if isinstance(block, int):
+                kept_blocks.add(block)
+                start = inst_starts[block]
+                end = inst_starts[block + 1]
+                kept_insts[start:end] = b'\x01' * (end - start)
+                continue
+            block_idx, label_ref, items = block
+            if block_idx is None:
+                new_result_refs.add(label_ref)
+            else:
+                kept_blocks.add(block_idx)
+            for item in items:
+                if isinstance(item, range):
+                    kept_insts[item.start:item.stop] = b'\x01' * len(item)
+                else:
+                    new_result_refs.add(item[2])
+
+        # Remove the old instructions that are not reused, and the basic
+        # blocks (which are inserted again in the new order). The IDs that
+        # are not defined in the new body are destroyed together with
+        # their debug and decoration instructions (as when the instructions
+        # are destroyed in the worker), while the other IDs are reused by
+        # the new instructions.
+        function.source_range = None
+        removed_ids = []
+        inst_idx = kept_insts.find(0)
+        while inst_idx >= 0:
+            inst = old_insts[inst_idx]
+            inst.basic_block.remove_inst(inst)
+            if inst.result_id is not None:
+                removed_ids.append(inst.result_id)
+            inst_idx = kept_insts.find(0, inst_idx + 1)
+        for block_idx, basic_block in enumerate(old_blocks):
+            function.basic_blocks.remove(basic_block)
+            if block_idx not in kept_blocks:
+                removed_ids.append(basic_block.inst.result_id)
+        for id_obj in removed_ids:
+            id_obj.inst = None
+            if _id_ref(id_obj) not in new_result_refs:
+                for inst in id_obj.uses:
+                    inst.destroy()
+                del self.old_ids[_id_ref(id_obj)]
+
+        for block in basic_blocks:
+            if isinstance(block, int):
+                function.basic_blocks.append(old_blocks[block])
+                continue
+            block_idx, label_ref, items = block
+            if block_idx is None:
+                basic_block = ir.BasicBlock(self.module,
+                                            self._get_id(worker, label_ref))
+                function.append_basic_block(basic_block)
+                start = end = 0
+            else:
+                # The instructions in the basic block already belong to
+                # the function.
+                basic_block = old_blocks[block_idx]
+                function.basic_blocks.append(basic_block)
+                start = inst_starts[block_idx]
+                end = inst_starts[block_idx + 1]
+            self._update_block(worker, basic_block, items, old_insts,
+                               start, end)
+
+    def _update_block(self, worker, basic_block, items, old_insts, start,
+                      end):
+        """Update the instructions in basic_block to be items.
+
+        The old_insts[start:end] are the instructions that were in
+        basic_block, and the runs of them that are still in the same order
+        are kept in place. The other instructions are moved or created."""
+        prev_inst = None
+        next_idx = start
+        for item in items:
+            if not isinstance(item, range):
+                inst = self._decode_inst(worker, item)
+                if prev_inst is None:
+                    basic_block.prepend_inst(inst)
+                else:
+                    basic_block.insert_inst_after(inst, prev_inst)
+                prev_inst = inst
+            elif next_idx <= item.start and item.stop <= end:
+                prev_inst = old_insts[item.stop - 1]
+                next_idx = item.stop
+            else:
+                for inst_idx in item:
+                    inst = old_insts[inst_idx]
+                    inst.basic_block.insts.remove(inst)
+                    if prev_inst is None:
+                        basic_block.insts.prepend(inst)
+                    else:
+                        basic_block.insts.insert_after(inst, prev_inst)
+                    inst.basic_block = basic_block
+                    inst.function = basic_block.function
+                    prev_inst = inst
+
+
+def run_pass(pass_manager, pass_module, functions, processes):
+    """Run pass_module on functions in processes worker processes.
+
+    The pass must have a process_function(module, function, pass_manager)
+    function, which is called for each function in the workers. If the pass
+    has MODULE_PASS set, its run function is then called (with an empty
+    list of functions) to process the rest of the module.
+
+    The PassResult for the pass is returned."""
+    global _state
+    module = pass_manager.module
+    functions = pm.get_functions(module, functions)
+    try:
+        context = multiprocessing.get_context('fork')
+    except ValueError:
+        context = None
+    if context is None or processes < 2 or len(functions) < 2:
+        return pass_module.run(module, pass_manager, functions)
+    # The uses of the IDs are only recorded for the decoded function bodies,
+    # so all lazily loaded bodies are decoded before forking. Otherwise, the
+    # global instructions used only by functions the workers do not change
+    # would look unused in this process (and be removed by MODULE_PASS
+    # passes).
+    for function in module.functions:
+        function.basic_blocks
+    merger = _Merger(module)
+    changed_functions = set()
+    module_changed = False
+    # The instructions and IDs created when merging are copies of the ones
+    # created by the workers, so the statistics are taken from the workers.
+    statistics = module._statistics
+    module._statistics = None
+    _state = (module, pass_manager, pass_module, functions, statistics)
+    try:
+        pool = context.Pool(min(processes, len(functions)))
+        try:
+            chunksize = max(1, len(functions) // (processes * 4))
+            for worker, idx, new_globals, basic_blocks, counts in pool.imap(
+                    _process_function, range(len(functions)), chunksize):
+                function = functions[idx]
+                module_changed |= bool(new_globals)
+                if merger.merge(worker, function, new_globals, basic_blocks):
+                    changed_functions.add(function)
+                if counts is not None:
+                    statistics.insts_created += counts[0]
+                    statistics.insts_destroyed += counts[1]
+                    statistics.ids_allocated += counts[2]
+        finally:
+            pool.close()
+            pool.join()
+    finally:
+        _state = None
+        module._statistics = statistics
+
+    # The changed basic blocks are new objects, so the function analyses
+    # for the changed functions are invalid even if the pass preserves
+    # them.
+    pass_manager.invalidate(tuple(pm.MODULE_ANALYSES), changed_functions)
+
+    if getattr(pass_module, 'MODULE_PASS', False):
+        result = pass_module.run(module, pass_manager, ())
+        module_changed |= result.changed
+    return pm.make_result(module_changed, changed_functions)
@@ -0,0 +1,204 @@
+"""Run optimization passes, and cache the analyses they use.
+
+A pass is a module with a run(module, pass_manager=None, functions=None)
+function. The pass only processes the functions in functions (or all
+functions if it is None), and it returns a PassResult telling if it changed
+the module, and which functions it changed.
+
+The pass gets the analyses it needs by calling pass_manager.get_analysis
+(or by calling the functions in analyses.py directly when pass_manager
+is None), and it declares the analyses that are still valid after it has
+run in a PRESERVED_ANALYSES set. All other analyses are invalidated for
+the changed functions (and for the module) after the pass has run.
+
+A pass that processes the module outside of the functions (such as the
+global instructions, or the set of functions) sets MODULE_PASS to True,
+so that run_to_fixed_point reruns it when the module changes even if no
+function changed.
+
+A pass having a process_function(module, function, pass_manager) function
+(which runs the pass on one function, and returns True if it changed the
+function) can be run on several functions in parallel, as described in
+parallel.py. The pass manager does this when it is created with processes
+larger than 1.
+
+The time and IR size changes for each pass run are recorded in the
+statistics.PassStatistics object passed to the pass manager (if any)."""
+import collections
+
+from spirv_tools.passes import analyses
+
+
+# The analyses computed per function.
+FUNCTION_ANALYSES = {
+    'dominators': analyses.dominators,
+    'predecessors': analyses.predecessors,
+    'reachable': analyses.reachable_blocks,
+}
+
+# The analyses computed for the whole module.
+MODULE_ANALYSES = {
+    'call_graph': analyses.call_graph,
+}
+
+# The result of running a pass. The changed is True if the pass changed
+# the module, and functions is the set of functions it changed (which may
+# be empty even if changed is True, such as when the pass only removed
+# global instructions or functions).
+PassResult = collections.namedtuple('PassResult', ['changed', 'functions'])
+
+# The result of a pass that did not change anything.
+UNCHANGED = PassResult(False, frozenset())
+
+
+def make_result(module_changed, changed_functions):
+    """Return the PassResult for a pass.
+
+    The module_changed tells if the pass changed the module outside of
+    the changed_functions."""
+    changed_functions = frozenset(changed_functions)
+    if not module_changed and not changed_functions:
+        return UNCHANGED
+    return PassResult(True, changed_functions)
+
+
+def get_functions(module, functions):
+    """Return the functions a pass is to process.
+
+    This is the functions in module if functions is None, and otherwise
+    the functions in functions that are still in the module, in the order
+    they are in the module."""
+    if functions is None:
+        return list(module.functions)
+    return [function for function in module.functions
+            if function in functions]
+
+
+class PassManager(object):
+    """Runs passes on a module, and caches the analyses they use.
+
+    The passes are run in processes worker processes if processes is larger
+    than 1 (and the passes support it), and each pass run is recorded in
+    statistics if it is not None."""
+    def __init__(self, module, processes=1, statistics=None):
+        self.module = module
+        self.processes = processes
+        self.statistics = statistics
+        # The cached results, indexed by (analysis name, function), where
+        # the function is None for module analyses.
+        self._results = {}
+
+    def get_analysis(self, name, function=None):
+        """Return the result of the analysis name.
+
+        The function must be provided for function analyses, and must be
+        None for module analyses. The result is computed the first time
+        it is requested, and the same result is then returned until the
+        analysis is invalidated. The result must not be modified."""
+        key = (name, function)
+        if key not in self._results:
+            if function is None:
+                if name not in MODULE_ANALYSES:
+                    raise ValueError('Unknown module analysis ' + name)
+                self._results[key] = MODULE_ANALYSES[name](self.module)
+            else:
+                if name not in FUNCTION_ANALYSES:
+                    raise ValueError('Unknown function analysis ' + name)
+                self._results[key] = FUNCTION_ANALYSES[name](function)
+        return self._results[key]
+
+    def invalidate(self, preserved=(), functions=None):
+        """Discard the cached analyses, except the ones named in preserved.
+
+        If functions is provided, only the analyses for those functions (and
+        the module analyses) are discarded. The analyses for functions that
+        have been removed from the module are always discarded."""
+        module_functions = self.module.functions
+        for key in list(self._results):
+            name, key_function = key
+            if (key_function is not None and
+                    key_function not in module_functions):
+                del self._results[key]
+            elif name in preserved:
+                continue
+            elif (functions is None or key_function is None or
+                  key_function in functions):
+                del self._results[key]
+
+    def run_pass(self, pass_module, functions=None):
+        """Run one pass, and invalidate the analyses it does not preserve.
+
+        The pass is only run on the functions in functions if it is
+        provided. The PassResult from the pass is returned."""
+        if self.statistics is None:
+            result = self._run_pass(pass_module, functions)
+        else:
+            stats_state = self.statistics.start_pass(self.module, pass_module)
+            try:
+                result = self._run_pass(pass_module, functions)
+            finally:
+                self.statistics.end_pass(self.module, stats_state)
+        if result is None:
+            # The pass does not tell what it changed.
+            result = PassResult(True, frozenset(self.module.functions))
+            self.invalidate(getattr(pass_module, 'PRESERVED_ANALYSES', ()))
+        elif result.changed:
+            self.invalidate(getattr(pass_module, 'PRESERVED_ANALYSES', ()),
+                            result.functions)
+        return result
+
+    def _run_pass(self, pass_module, functions):
+        """Run one pass, and return its result."""
+        if self.processes > 1 and hasattr(pass_module, 'process_function'):
+            # parallel imports this module, so it cannot be imported at
+            # the top of the file.
+            from spirv_tools.passes import parallel
+            return parallel.run_pass(self, pass_module, functions,
+                                     self.processes)
+        return pass_module.run(self.module, self, functions)
+
+    def run(self, pass_modules):
+        """Run the passes in order."""
+        for pass_module in pass_modules:
+            self.run_pass(pass_module)
+
+    def run_to_fixed_point(self, pass_modules, max_iterations=10):
+        """Run the passes until they do not change the module.
+
+        The passes are first run in order on all functions. After that,
+        a pass is only rerun on the functions that have been changed (by
+        any pass) since it last ran, and passes having MODULE_PASS set are
+        also rerun when the module has changed. This is iterated until no
+        pass changes anything, or until the passes have been run
+        max_iterations times.
+
+        A dictionary mapping each pass module to the number of times it
+        was run is returned."""
+        pass_modules = list(collections.OrderedDict.fromkeys(pass_modules))
+        # The functions each pass needs to process, where None in the set
+        # means that the module has changed.
+        dirty = dict((pass_module, set(self.module.functions) | set([None]))
+                     for pass_module in pass_modules)
+        iteration_counts = dict((pass_module, 0)
+                                for pass_module in pass_modules)
+        for _ in range(max_iterations):
+            ran_pass = False
+            for pass_module in pass_modules:
+                functions = dirty[pass_module]
+                module_changed = None in functions
+                functions.discard(None)
+                if not functions and not (
+                        module_changed and
+                        getattr(pass_module, 'MODULE_PASS', False)):
+                    continue
+                dirty[pass_module] = set()
+                ran_pass = True
+                iteration_counts[pass_module] += 1
+                result = self.run_pass(pass_module, functions)
+                if result.changed:
+                    for other_dirty in dirty.values():
+                        other_dirty.update(result.functions)
+                        other_dirty.add(None)
+            if not ran_pass:
+                break
+        return iteration_counts
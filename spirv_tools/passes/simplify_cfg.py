@@ -11,6 +11,8 @@ Specifically:
   branch if all branch targets are identical.
 """
 from spirv_tools import ir
+from spirv_tools.passes import analyses
+from spirv_tools.passes import pass_manager as pm
 
 
 def update_conditional_branch(module, inst, dest_id):
@@ -23,98 +25,127 @@ def update_conditional_branch(module, inst, dest_id):
         basic_block.insts[-2].destroy()
 
 
-def simplify_cond_branches(module):
-    """Change conditional branches to unconditional branches if possible."""
-    for function in module.functions:
-        for basic_block in function.basic_blocks:
-            inst = basic_block.insts[-1]
-            if inst.op_name == 'OpBranchConditional':
-                cond_inst = inst.operands[0].inst
-                if cond_inst.op_name == 'OpConstantTrue':
-                    update_conditional_branch(module, inst, inst.operands[1])
-                elif cond_inst.op_name == 'OpConstantFalse':
-                    update_conditional_branch(module, inst, inst.operands[2])
-                elif inst.operands[1] == inst.operands[2]:
-                    update_conditional_branch(module, inst, inst.operands[1])
-            elif inst.op_name == 'OpSwitch':
-                default_id = inst.operands[1]
-                operands = inst.operands[2:]
-                while operands:
-                    if default_id != operands[1]:
-                        break
-                    operands = operands[2:]
-                else:
-                    update_conditional_branch(module, inst, default_id)
-
-
-def reachable(basic_block, reachable_blocks):
-    """Recursively mark basic blocks reachable from basic_block."""
-    reachable_blocks.add(basic_block)
-    for successor in basic_block.get_successors():
-        if successor not in reachable_blocks:
-            reachable(successor, reachable_blocks)
-
-
-def remove_unused_basic_blocks(module):
-    """Remove unreachable basic blocks."""
-    for function in module.functions:
-        reachable_blocks = set()
-        reachable(function.basic_blocks[0], reachable_blocks)
-        for basic_block in function.basic_blocks[:]:
-            if basic_block not in reachable_blocks:
-                basic_block.destroy()
+def simplify_cond_branches(module, function):
+    """Change conditional branches to unconditional branches if possible.
+
+    Return True if the function was changed."""
+    changed = False
+    for basic_block in function.basic_blocks:
+        inst = basic_block.insts[-1]
+        if inst.op_name == 'OpBranchConditional':
+            cond_inst = inst.operands[0].inst
+            if cond_inst.op_name == 'OpConstantTrue':
+                update_conditional_branch(module, inst, inst.operands[1])
+                changed = True
+            elif cond_inst.op_name == 'OpConstantFalse':
+                update_conditional_branch(module, inst, inst.operands[2])
+                changed = True
+            elif inst.operands[1] == inst.operands[2]:
+                update_conditional_branch(module, inst, inst.operands[1])
+                changed = True
+        elif inst.op_name == 'OpSwitch':
+            default_id = inst.operands[1]
+            operands = inst.operands[2:]
+            while operands:
+                if default_id != operands[1]:
+                    break
+                operands = operands[2:]
+            else:
+                update_conditional_branch(module, inst, default_id)
+                changed = True
+    return changed
+
+
+def remove_unused_basic_blocks(function, reachable_blocks):
+    """Remove the basic blocks not in reachable_blocks.
 
+    Return True if the function was changed."""
+    changed = False
+    for basic_block in function.basic_blocks[:]:
+        if basic_block not in reachable_blocks:
+            basic_block.destroy()
+            changed = True
+    return changed
 
-def get_merge_targest(module):
+
+def get_merge_targest(function):
     """Return a set of basic blocks that are targets of merge instructions."""
     merge_targets = set()
-    for function in module.functions:
-        for basic_block in function.basic_blocks:
-            if (len(basic_block.insts) > 1 and
-                    basic_block.insts[-2] in ['OpLoopMerge',
-                                              'OpSelectionMerge']):
-                target_id = basic_block.inst.operands[0]
-                merge_targets.add(target_id.inst.basic_block)
+    for basic_block in function.basic_blocks:
+        if (len(basic_block.insts) > 1 and
+                basic_block.insts[-2] in ['OpLoopMerge',
+                                          'OpSelectionMerge']):
+            target_id = basic_block.inst.operands[0]
+            merge_targets.add(target_id.inst.basic_block)
     return merge_targets
 
 
-def merge_basic_blocks(module):
+def merge_basic_blocks(function):
     """Merges a basic block into its predecessor if there is only one and
-    the predecessor only has one successor."""
-    merge_targets = get_merge_targest(module)
-    for function in module.functions:
-        for basic_block in reversed(function.basic_blocks[1:]):
-            predecessors = basic_block.predecessors()
-            if len(predecessors) == 1 and basic_block not in merge_targets:
-                pred_block = predecessors[0]
-                if pred_block.insts[-1].op_name == 'OpBranch':
-                    pred_block.insts[-1].destroy()
-                    for inst in basic_block.insts[:]:
-                        inst.remove()
-                        pred_block.append_inst(inst)
-                    basic_block.destroy()
-
-
-def eliminate_phi_nodes(module):
-    """Eliminates PHI nodes where all variables are identical."""
-    for function in module.functions:
-        for basic_block in function.basic_blocks:
-            for inst in basic_block.insts:
-                if inst.op_name != 'OpPhi':
+    the predecessor only has one successor.
+
+    Return True if the function was changed."""
+    merge_targets = get_merge_targest(function)
+    changed = False
+    for basic_block in reversed(function.basic_blocks[1:]):
+        predecessors = basic_block.predecessors()
+        if len(predecessors) == 1 and basic_block not in merge_targets:
+            pred_block = predecessors[0]
+            if pred_block.insts[-1].op_name == 'OpBranch':
+                pred_block.insts[-1].destroy()
+                for inst in basic_block.insts[:]:
+                    inst.remove()
+                    pred_block.append_inst(inst)
+                basic_block.destroy()
+                changed = True
+    return changed
+
+
+def eliminate_phi_nodes(function):
+    """Eliminates PHI nodes where all variables are identical.
+
+    Return True if the function was changed."""
+    changed = False
+    for basic_block in function.basic_blocks:
+        for inst in basic_block.insts:
+            if inst.op_name != 'OpPhi':
+                break
+            # Dead PHI nodes are left for dead_inst_elim.
+            if not inst.uses():
+                continue
+            first_variable = inst.operands[0]
+            operands = inst.operands[2:]
+            while operands:
+                if first_variable != operands[0]:
                     break
-                first_variable = inst.operands[0]
-                operands = inst.operands[2:]
-                while operands:
-                    if first_variable != operands[0]:
-                        break
-                    operands = operands[2:]
-                else:
-                    inst.replace_uses_with(first_variable.inst)
-
-
-def run(module):
+                operands = operands[2:]
+            else:
+                inst.replace_uses_with(first_variable.inst)
+                changed = True
+    return changed
+
+
+def process_function(module, function, pass_manager=None):
+    """Run the pass on one function.
+
+    Return True if the function was changed."""
+    changed = simplify_cond_branches(module, function)
+    if changed or pass_manager is None:
+        # The cached reachability is not valid if simplify_cond_branches
+        # changed the CFG.
+        reachable_blocks = analyses.reachable_blocks(function)
+    else:
+        reachable_blocks = pass_manager.get_analysis('reachable', function)
+    changed |= remove_unused_basic_blocks(function, reachable_blocks)
+    changed |= merge_basic_blocks(function)
+    changed |= eliminate_phi_nodes(function)
+    return changed
+
+
+def run(module, pass_manager=None, functions=None):
     """Perform dead code elimination and basic block merging."""
-    simplify_cond_branches(module)
-    remove_unused_basic_blocks(module)
-    merge_basic_blocks(module)
-    eliminate_phi_nodes(module)
+    changed_functions = set()
+    for function in pm.get_functions(module, functions):
+        if process_function(module, function, pass_manager):
+            changed_functions.add(function)
+    return pm.make_result(False, changed_functions)
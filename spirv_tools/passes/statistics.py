@@ -0,0 +1,138 @@
+"""Collect timing and IR size statistics for the passes.
+
+The statistics are collected by passing a PassStatistics object to the
+PassManager (or to passes.optimize and passes.run_pipeline), which then
+records each pass run. Nothing is recorded when no PassStatistics object
+is provided.
+
+The module refers to the PassStatistics object while a pass is recorded,
+and the IR updates its insts_created, insts_destroyed, and ids_allocated
+counters when instructions and temporary IDs are created or destroyed.
+The instructions decoded from lazily loaded function bodies are not
+counted as created, and the instructions in function bodies that have not
+been decoded are counted from the binary, so collecting statistics does
+not decode any function bodies."""
+import collections
+import sys
+import timeit
+
+
+# The statistics for one pass. The time is the wall time in seconds, and
+# insts_before/insts_after are the number of instructions in the module
+# before the first and after the last run of the pass.
+PassStats = collections.namedtuple('PassStats', [
+    'name', 'runs', 'time', 'insts_before', 'insts_after',
+    'insts_created', 'insts_destroyed', 'ids_allocated'])
+
+
+def get_pass_name(pass_module):
+    """Return the name of the pass implemented by pass_module."""
+    return pass_module.__name__.rsplit('.', 1)[-1]
+
+
+def count_instructions(module, cache=None):
+    """Return the number of instructions in module.
+
+    The function bodies that have not been decoded yet are counted from
+    the binary, where cache is a dictionary caching their counts."""
+    count = sum(len(insts_list)
+                for insts_list in module.global_instructions.sections())
+    for function in module.functions:
+        if function.is_body_decoded():
+            count += 2 + len(function.parameters)
+            for basic_block in function.basic_blocks:
+                count += 1 + len(basic_block.insts)
+        elif cache is not None and function in cache:
+            count += cache[function]
+        else:
+            # The source_range contains the whole function.
+            words = module.source_words
+            idx, end = function.source_range
+            function_count = 0
+            while idx < end:
+                idx += words[idx] >> 16
+                function_count += 1
+            if cache is not None:
+                cache[function] = function_count
+            count += function_count
+    return count
+
+
+class PassStatistics(object):
+    """Records the time and IR size changes for each pass run."""
+    def __init__(self):
+        # The PassStats for each pass run, in the order they were run.
+        self.records = []
+        # The number of instructions created and destroyed, and the
+        # number of temporary IDs allocated, while recording the passes.
+        self.insts_created = 0
+        self.insts_destroyed = 0
+        self.ids_allocated = 0
+        # The instruction counts for function bodies that are not decoded.
+        self._body_counts = {}
+
+    def start_pass(self, module, pass_module):
+        """Start recording a run of pass_module on module.
+
+        The returned object is to be passed to end_pass when the pass
+        has finished."""
+        insts_before = count_instructions(module, self._body_counts)
+        module._statistics = self
+        return (pass_module, insts_before, self.insts_created,
+                self.insts_destroyed, self.ids_allocated,
+                timeit.default_timer())
+
+    def end_pass(self, module, state):
+        """Finish recording the pass run started by start_pass."""
+        end_time = timeit.default_timer()
+        module._statistics = None
+        (pass_module, insts_before, insts_created, insts_destroyed,
+         ids_allocated, start_time) = state
+        self.records.append(PassStats(
+            get_pass_name(pass_module), 1, end_time - start_time,
+            insts_before, count_instructions(module, self._body_counts),
+            self.insts_created - insts_created,
+            self.insts_destroyed - insts_destroyed,
+            self.ids_allocated - ids_allocated))
+
+    def report(self):
+        """Return a list of PassStats, with the runs combined per pass.
+
+        The passes are listed in the order they were first run."""
+        totals = collections.OrderedDict()
+        for record in self.records:
+            total = totals.get(record.name)
+            if total is None:
+                totals[record.name] = record
+            else:
+                totals[record.name] = PassStats(
+                    record.name, total.runs + record.runs,
+                    total.time + record.time, total.insts_before,
+                    record.insts_after,
+                    total.insts_created + record.insts_created,
+                    total.insts_destroyed + record.insts_destroyed,
+                    total.ids_allocated + record.ids_allocated)
+        return list(totals.values())
+
+    def dump_timing(self, stream=sys.stderr):
+        """Write the time spent in each pass to stream."""
+        report = self.report()
+        total_time = sum(stats.time for stats in report)
+        stream.write('%10s %7s %5s  %s\n' % ('Time (s)', '%', 'Runs', 'Pass'))
+        for stats in report:
+            percent = 100.0 * stats.time / total_time if total_time else 0.0
+            stream.write('%10.4f %6.1f%% %5d  %s\n' % (
+                stats.time, percent, stats.runs, stats.name))
+        stream.write('%10.4f %6.1f%% %5d  %s\n' % (
+            total_time, 100.0, sum(stats.runs for stats in report), 'Total'))
+
+    def dump_stats(self, stream=sys.stderr):
+        """Write the IR size changes for each pass to stream."""
+        stream.write('%5s %8s %8s %8s %9s %6s  %s\n' % (
+            'Runs', 'Before', 'After', 'Created', 'Destroyed', 'IDs',
+            'Pass'))
+        for stats in self.report():
+            stream.write('%5d %8d %8d %8d %9d %6d  %s\n' % (
+                stats.runs, stats.insts_before, stats.insts_after,
+                stats.insts_created, stats.insts_destroyed,
+                stats.ids_allocated, stats.name))
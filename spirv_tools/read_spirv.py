@@ -1,6 +1,10 @@
 """Create a module from a SPIR-V binary read from a stream."""
 import array
-from operator import itemgetter
+import collections
+import functools
+import mmap as mmap_module
+import multiprocessing
+import sys
 
 from spirv_tools import spirv
 from spirv_tools import ir
@@ -10,14 +14,54 @@ class ParseError(Exception):
     """Raised when encountering invalid SPIR-V constructs while parsing."""
 
 
+# One instruction as returned by iter_instructions. The words are a
+# memoryview of all the instruction's words (including the first word
+# containing the opcode and word count).
+RawInstruction = collections.namedtuple('RawInstruction',
+                                        ['opcode', 'word_offset', 'words'])
+
+# The result for one file as returned by read_modules. Exactly one of
+# module and error is None.
+ReadResult = collections.namedtuple('ReadResult', ['path', 'module', 'error'])
+
+
+class ByteSwappedWords(object):
+    """Read-only view of a sequence of words with the byte order swapped.
+
+    The words are swapped when they are accessed, so this can be used
+    for binaries that cannot (or should not) be modified in place, such
+    as memory-mapped files."""
+    def __init__(self, words):
+        self.words = words
+
+    def __len__(self):
+        return len(self.words)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            result = array.array('I', self.words[idx])
+            result.byteswap()
+            return result
+        word = self.words[idx]
+        return (((word & 0xff) << 24) | ((word & 0xff00) << 8) |
+                ((word >> 8) & 0xff00) | (word >> 24))
+
+
 class SpirvBinary(object):
-    """This class represent the SPIR-V binary being parsed."""
+    """This class represent the SPIR-V binary being parsed.
+
+    The words may be an array.array or a memoryview of 32-bit words.
+    Byte-swapped arrays are swapped in place, while other sequences are
+    wrapped in a ByteSwappedWords view."""
     def __init__(self, words):
         if len(words) < 5:
             raise ParseError('File length shorter than header size')
         magic = words[0]
         if magic != ir.MAGIC:
-            words.byteswap()
+            if isinstance(words, array.array):
+                words.byteswap()
+            else:
+                words = ByteSwappedWords(words)
             magic = words[0]
             if magic != ir.MAGIC:
                 raise ParseError('Incorrect magic: ' + format(magic, '#x'))
@@ -115,20 +159,6 @@ class SpirvBinary(object):
             raise ParseError('Spurius words after parsing instruction')
 
 
-def parse_literal_string(binary):
-    """Parse one LiteralString."""
-    result = []
-    while True:
-        word = binary.get_next_word()
-        for _ in range(4):
-            octet = word & 255
-            if octet == 0:
-                return ''.join(result)
-            result.append(chr(octet))
-            word >>= 8
-    raise ParseError('bad encoding')
-
-
 def parse_id(binary, module, accept_eol=False):
     """Parse one Id."""
     word = binary.get_next_word(accept_eol=accept_eol)
@@ -142,114 +172,280 @@ def parse_id(binary, module, accept_eol=False):
         return None
 
 
+def _build_enum_names():
+    """Return a dictionary mapping each enum kind to a value->name table."""
+    enum_names = {}
+    for kind, constants in spirv.spv.items():
+        if isinstance(constants, dict):
+            names = {}
+            for name in constants:
+                names.setdefault(constants[name], name)
+            enum_names[kind] = names
+    return enum_names
+
+
+def _build_mask_bit_names():
+    """Return a dictionary mapping each mask kind to a bit->name table."""
+    mask_bit_names = {}
+    for kind in ir.MASKS:
+        constants = spirv.spv[kind]
+        if isinstance(constants, dict):
+            bit_names = {}
+            for name in constants:
+                if constants[name] != 0:
+                    bit_names.setdefault(constants[name], name)
+            mask_bit_names[kind] = bit_names
+    return mask_bit_names
+
+
+_OPFUNCTIONEND = spirv.spv['Op']['OpFunctionEnd']
+_OPFUNCTIONPARAMETER = spirv.spv['Op']['OpFunctionParameter']
+
+_ENUM_NAMES = _build_enum_names()
+_MASK_BIT_NAMES = _build_mask_bit_names()
+
+
 def expand_mask(kind, value):
-    """Convert the mask value to a list of mask strings."""
+    """Convert the mask value to a list of mask strings.
+
+    The mask strings are ordered by increasing bit value."""
     result = []
-    if value != 0:
-        mask_values = zip(spirv.spv[kind].values(), spirv.spv[kind].keys())
-        mask_values = sorted(mask_values, key=itemgetter(0))
-        for mask_number, mask_token in mask_values:
-            if (mask_number & value) != 0:
-                result.append(mask_token)
-                value = value ^ mask_number
-        if value != 0:
+    bit_names = _MASK_BIT_NAMES[kind]
+    while value != 0:
+        bit = value & -value
+        if bit not in bit_names:
             raise ParseError('Invalid mask value')
+        result.append(bit_names[bit])
+        value = value ^ bit
     return result
 
 
-def parse_operand(binary, module, kind):
-    """Parse one instruction operand."""
-    if kind == 'Id':
-        return [parse_id(binary, module)]
-    elif kind == 'LiteralNumber':
-        return [binary.get_next_word()]
-    elif kind == 'LiteralString':
-        return [parse_literal_string(binary)]
-    elif kind == 'OptionalLiteralString':
-        word = binary.get_next_word(peek=True, accept_eol=True)
-        if word is None:
-            return []
-        return [parse_literal_string(binary)]
-    elif kind == 'VariableLiteralNumber' or kind == 'OptionalLiteralNumber':
-        operands = []
-        while True:
-            word = binary.get_next_word(accept_eol=True)
-            if word is None:
-                return operands
-            operands.append(word)
-    elif kind in ['VariableId', 'OptionalId']:
-        operands = []
-        while True:
-            tmp_id = parse_id(binary, module, accept_eol=True)
-            if tmp_id is None:
-                return operands
-            operands.append(tmp_id)
-    elif kind == 'VariableIdLiteralPair':
-        operands = []
-        while True:
-            tmp_id = parse_id(binary, module, accept_eol=True)
-            if tmp_id is None:
-                return operands
-            operands.append(tmp_id)
-            word = binary.get_next_word()
-            operands.append(word)
-    elif kind == 'VariableLiteralIdPair':
-        operands = []
-        while True:
-            word = binary.get_next_word(accept_eol=True)
-            if word is None:
-                return operands
-            operands.append(word)
-            tmp_id = parse_id(binary, module)
-            operands.append(tmp_id)
-    elif kind == 'OptionalMemoryAccessMask':
-        val = binary.get_next_word(accept_eol=True)
-        if val is None:
-            return []
-        result = expand_mask(kind[8:], val)
-        try:
-            aligned_idx = result.index('Aligned')
-        except ValueError:
-            pass
-        else:
-            result[aligned_idx] = (
-                    'Aligned', binary.get_next_word(accept_eol=False))
-        return [result]
+def _get_id(module, value):
+    """Return the Id object for the ID value, creating it if needed."""
+    id_obj = module.value_to_id.get(value)
+    if id_obj is None:
+        id_obj = ir.Id(module, value)
+        module.value_to_id[value] = id_obj
+    return id_obj
+
 
+def _decode_string(words, idx, end):
+    """Decode a LiteralString starting at words[idx].
+
+    Returns a pair of the string and the index of the first word after
+    the string."""
+    data = array.array('I', words[idx:end])
+    if sys.byteorder == 'big':
+        data.byteswap()
+    data = data.tobytes()
+    length = data.find(b'\0')
+    if length < 0:
+        raise ParseError('Incorrect instruction length')
+    return data[:length].decode('latin-1'), idx + length // 4 + 1
+
+
+def _decode_id_operand(module, words, idx, end, operands):
+    if idx == end:
+        raise ParseError('Incorrect instruction length')
+    operands.append(_get_id(module, words[idx]))
+    return idx + 1
+
+
+def _decode_literal_number(module, words, idx, end, operands):
+    if idx == end:
+        raise ParseError('Incorrect instruction length')
+    operands.append(words[idx])
+    return idx + 1
+
+
+def _decode_literal_string(module, words, idx, end, operands):
+    string, idx = _decode_string(words, idx, end)
+    operands.append(string)
+    return idx
+
+
+def _decode_optional_literal_string(module, words, idx, end, operands):
+    if idx == end:
+        return idx
+    string, idx = _decode_string(words, idx, end)
+    operands.append(string)
+    return idx
+
+
+def _decode_variable_literal_number(module, words, idx, end, operands):
+    operands.extend(words[idx:end])
+    return end
+
+
+def _decode_variable_id(module, words, idx, end, operands):
+    operands.extend([_get_id(module, word) for word in words[idx:end]])
+    return end
+
+
+def _decode_variable_id_literal_pair(module, words, idx, end, operands):
+    if (end - idx) % 2 != 0:
+        raise ParseError('Incorrect instruction length')
+    for i in range(idx, end, 2):
+        operands.append(_get_id(module, words[i]))
+        operands.append(words[i + 1])
+    return end
+
+
+def _decode_variable_literal_id_pair(module, words, idx, end, operands):
+    if (end - idx) % 2 != 0:
+        raise ParseError('Incorrect instruction length')
+    for i in range(idx, end, 2):
+        operands.append(words[i])
+        operands.append(_get_id(module, words[i + 1]))
+    return end
+
+
+def _decode_optional_memory_access_mask(module, words, idx, end, operands):
+    if idx == end:
+        return idx
+    result = expand_mask('MemoryAccessMask', words[idx])
+    idx += 1
+    try:
+        aligned_idx = result.index('Aligned')
+    except ValueError:
+        pass
+    else:
+        if idx == end:
+            raise ParseError('Incorrect instruction length')
+        result[aligned_idx] = ('Aligned', words[idx])
+        idx += 1
+    operands.append(result)
+    return idx
+
+
+def _make_mask_decoder(kind, is_optional):
+    """Return a decoder for a mask operand of the given kind."""
+    def decode(module, words, idx, end, operands):
+        if idx == end:
+            if is_optional:
+                return idx
+            raise ParseError('Incorrect instruction length')
+        operands.append(expand_mask(kind, words[idx]))
+        return idx + 1
+    return decode
+
+
+def _make_enum_decoder(kind):
+    """Return a decoder for an enumerated constant operand of the kind."""
+    names = _ENUM_NAMES[kind]
+    def decode(module, words, idx, end, operands):
+        if idx == end:
+            raise ParseError('Incorrect instruction length')
+        val = words[idx]
+        if val not in names:
+            raise ParseError('Unknown "' + kind + '" value' + str(val))
+        operands.append(names[val])
+        return idx + 1
+    return decode
+
+
+def _make_unknown_kind_decoder(kind):
+    """Return a decoder reporting that the operand kind is not handled."""
+    def decode(module, words, idx, end, operands):
+        raise ParseError('Unknown kind "' + kind + '"')
+    return decode
+
+
+_OPERAND_DECODERS = {
+    'Id': _decode_id_operand,
+    'LiteralNumber': _decode_literal_number,
+    'LiteralString': _decode_literal_string,
+    'OptionalLiteralString': _decode_optional_literal_string,
+    'VariableLiteralNumber': _decode_variable_literal_number,
+    'OptionalLiteralNumber': _decode_variable_literal_number,
+    'VariableId': _decode_variable_id,
+    'OptionalId': _decode_variable_id,
+    'VariableIdLiteralPair': _decode_variable_id_literal_pair,
+    'VariableLiteralIdPair': _decode_variable_literal_id_pair,
+    'OptionalMemoryAccessMask': _decode_optional_memory_access_mask,
+}
+
+
+def _get_operand_decoder(kind):
+    """Return the decoder function for one operand kind."""
+    if kind in _OPERAND_DECODERS:
+        return _OPERAND_DECODERS[kind]
     elif kind[:8] == 'Optional' and kind[-4:] == 'Mask':
-        val = binary.get_next_word(accept_eol=True)
-        if val is None:
-            return []
-        return [expand_mask(kind[8:], val)]
+        return _make_mask_decoder(kind[8:], True)
     elif kind in ir.MASKS:
-        val = binary.get_next_word()
-        return [expand_mask(kind, val)]
+        return _make_mask_decoder(kind, False)
     elif kind in spirv.spv:
-        val = binary.get_next_word()
-        constants = spirv.spv[kind]
-        for name in constants:
-            if constants[name] == val:
-                return [name]
-        raise ParseError('Unknown "' + kind + '" value' + str(val))
+        return _make_enum_decoder(kind)
+    return _make_unknown_kind_decoder(kind)
+
+
+def _build_inst_decoders():
+    """Build the table of instruction decoders, indexed by opcode.
 
-    raise ParseError('Unknown kind "' + kind + '"')
+    Each entry is a tuple of the operation name, the instruction's
+    type/result flags, the number of leading Id operands (that are
+    decoded directly by parse_instruction), and the tuple of decoders
+    for the remaining operands. Unused opcodes have the entry None."""
+    decoders = [None] * (max(ir.OPCODE_TO_OPNAME) + 1)
+    for opcode, op_name in ir.OPCODE_TO_OPNAME.items():
+        if op_name not in ir.INST_FORMAT:
+            continue
+        op_format = ir.INST_FORMAT[op_name]
+        kinds = op_format['operands']
+        nof_ids = 0
+        while nof_ids < len(kinds) and kinds[nof_ids] == 'Id':
+            nof_ids += 1
+        operand_decoders = tuple(_get_operand_decoder(kind)
+                                 for kind in kinds[nof_ids:])
+        decoders[opcode] = (op_name, op_format['type'], op_format['result'],
+                            nof_ids, operand_decoders)
+    return decoders
+
+
+_INST_DECODERS = _build_inst_decoders()
 
 
 def parse_instruction(binary, module):
     """Parse one instruction."""
-    op_name, op_format = binary.get_next_opcode()
-    operands = []
+    words = binary.words
+    idx = binary.idx
+    if idx == len(words):
+        raise ParseError('Unexpected end of file')
+    opcode = words[idx] & 0xFFFF
+    end = idx + (words[idx] >> 16)
+    if opcode >= len(_INST_DECODERS) or _INST_DECODERS[opcode] is None:
+        raise ParseError('Invalid opcode ' + str(opcode))
+    if end <= idx:
+        raise ParseError('Incorrect instruction length')
+    if end > len(words):
+        raise ParseError('Unexpected end of file')
+    op_name, has_type, has_result, nof_ids, operand_decoders = (
+        _INST_DECODERS[opcode])
+    idx += 1
+
     inst_type_id = None
-    if op_format['type']:
-        inst_type_id = parse_id(binary, module)
+    if has_type:
+        if idx == end:
+            raise ParseError('Incorrect instruction length')
+        inst_type_id = _get_id(module, words[idx])
+        idx += 1
     result_id = None
-    if op_format['result']:
-        result_id = parse_id(binary, module)
+    if has_result:
+        if idx == end:
+            raise ParseError('Incorrect instruction length')
+        result_id = _get_id(module, words[idx])
+        idx += 1
         if result_id.inst is not None:
             raise ParseError('ID ' + str(result_id) + ' is already defined')
-    for kind in op_format['operands']:
-        operands = operands + parse_operand(binary, module, kind)
-    binary.expect_eol()
+    if idx + nof_ids > end:
+        raise ParseError('Incorrect instruction length')
+    operands = [_get_id(module, word) for word in words[idx:idx + nof_ids]]
+    idx += nof_ids
+    for decode in operand_decoders:
+        idx = decode(module, words, idx, end, operands)
+    if idx != end:
+        raise ParseError('Spurius words after parsing instruction')
+    binary.idx = end
 
     if op_name == 'OpFunction':
         return ir.Function(module, operands[0], operands[1],
@@ -261,15 +457,31 @@ def parse_instruction(binary, module):
 
 def parse_global_instructions(binary, module):
     """Parse all global instructions (i.e. up to the first function)."""
+    global_insts = module.global_instructions
+    source_ranges = [None] * len(global_insts.source_ranges)
+    is_ordered = True
+    prev_order = 0
     while True:
         op_name, _ = binary.get_next_opcode(peek=True, accept_eol=True)
-        if op_name is None:
-            return
-        if op_name == 'OpFunction':
-            return
+        if op_name is None or op_name == 'OpFunction':
+            break
 
+        start_idx = binary.idx
         inst = parse_instruction(binary, module)
         module.insert_global_inst(inst)
+        _, order = global_insts._get_insts_list(inst.op_name)
+        if order < prev_order:
+            is_ordered = False
+        prev_order = order
+        if source_ranges[order] is None:
+            source_ranges[order] = (start_idx, binary.idx)
+        else:
+            source_ranges[order] = (source_ranges[order][0], binary.idx)
+
+    # The ranges can only be used if each kind of global instruction is
+    # placed contiguously in the binary (in the order used by the module).
+    if is_ordered:
+        global_insts.source_ranges = source_ranges
 
 
 def parse_basic_block(binary, module, function):
@@ -291,10 +503,19 @@ def parse_basic_block(binary, module, function):
             return
 
 
-def parse_function(binary, module):
-    """Parse one function."""
+def parse_function_header(binary, module):
+    """Parse the OpFunction and OpFunctionParameter instructions."""
     function = parse_instruction(binary, module)
+    while True:
+        op_name, _ = binary.get_next_opcode(peek=True)
+        if op_name != 'OpFunctionParameter':
+            return function
+        inst = parse_instruction(binary, module)
+        function.append_parameter(inst)
+
 
+def parse_function_body(binary, module, function):
+    """Parse the basic blocks and the OpFunctionEnd of a function."""
     while True:
         op_name, _ = binary.get_next_opcode(peek=True)
         if op_name == 'OpLabel':
@@ -302,16 +523,80 @@ def parse_function(binary, module):
         elif op_name == 'OpFunctionEnd':
             binary.get_next_opcode()
             binary.expect_eol()
-            return function
-        elif op_name == 'OpFunctionParameter':
-            inst = parse_instruction(binary, module)
-            function.append_parameter(inst)
+            return
         else:
             raise ParseError('Invalid opcode ' + op_name)
 
 
-def parse_functions(binary, module):
-    """Parse all functions (i.e. rest of the module)."""
+def skip_function_body(binary):
+    """Advance past the function body without decoding the instructions."""
+    words = binary.words
+    idx = binary.idx
+    while True:
+        if idx == len(words):
+            raise ParseError('Unexpected end of file')
+        word = words[idx]
+        if word >> 16 == 0:
+            raise ParseError('Incorrect instruction length')
+        idx += word >> 16
+        if word & 0xFFFF == _OPFUNCTIONEND:
+            if idx > len(words):
+                raise ParseError('Unexpected end of file')
+            binary.idx = idx
+            return
+
+
+def parse_function(binary, module):
+    """Parse one function."""
+    function = parse_function_header(binary, module)
+    parse_function_body(binary, module, function)
+    return function
+
+
+class LazyFunctionDecoder(object):
+    """Decodes the function bodies of a lazily read module on demand."""
+    def __init__(self, binary, value_to_id):
+        self.binary = binary
+        self.value_to_id = value_to_id
+
+    def decode_body(self, function, start_idx):
+        """Decode the function body starting at word start_idx."""
+        module = function.module
+        self.binary.idx = start_idx
+        module.value_to_id = self.value_to_id
+        source_range = function.source_range
+        try:
+            parse_function_body(self.binary, module, function)
+        finally:
+            del module.value_to_id
+        function.source_range = source_range
+
+
+def set_function_body_loaders(functions, words, value_to_id):
+    """Decode the bodies of the functions from words when first used.
+
+    The functions must have their OpFunction and OpFunctionParameter
+    instructions, but no basic blocks, and their source_range must be the
+    range of the function in words (which must be in native byte order).
+    The value_to_id dictionary maps the ID values used in words to the
+    Id objects already created in the functions' module."""
+    binary = SpirvBinary(words)
+    lazy_decoder = LazyFunctionDecoder(binary, value_to_id)
+    for function in functions:
+        idx, _ = function.source_range
+        idx += words[idx] >> 16
+        while words[idx] & 0xFFFF == _OPFUNCTIONPARAMETER:
+            idx += words[idx] >> 16
+        function.set_body_loader(functools.partial(lazy_decoder.decode_body,
+                                                   start_idx=idx))
+
+
+def parse_functions(binary, module, lazy_decoder=None):
+    """Parse all functions (i.e. rest of the module).
+
+    If lazy_decoder is provided, only the function headers are parsed,
+    and the function bodies are decoded by lazy_decoder when they are
+    first used."""
     while True:
         op_name, _ = binary.get_next_opcode(peek=True, accept_eol=True)
         if op_name is None:
@@ -319,23 +604,167 @@ def parse_functions(binary, module):
         if op_name != 'OpFunction':
             raise ParseError('Expected an "OpFunction" instruction')
 
-        function = parse_function(binary, module)
+        start_idx = binary.idx
+        if lazy_decoder is None:
+            function = parse_function(binary, module)
+        else:
+            function = parse_function_header(binary, module)
+            function.set_body_loader(functools.partial(
+                lazy_decoder.decode_body, start_idx=binary.idx))
+            skip_function_body(binary)
+        function.source_range = (start_idx, binary.idx)
         module.append_function(function)
 
 
-def read_module(stream):
-    """Create a module from a SPIR-V binary read from stream."""
-    data = stream.read()
-    if len(data) % 4 != 0:
-        raise ParseError('File length is not divisible by 4')
-    words = array.array('I', data)
-    binary = SpirvBinary(words)
+def parse_module(binary, lazy=False):
+    """Create a module from the SpirvBinary binary.
 
+    See read_module for a description of lazy."""
     module = ir.Module()
     module.value_to_id = {}
     try:
         parse_global_instructions(binary, module)
-        parse_functions(binary, module)
+        if lazy:
+            # IDs that are only used in the function bodies are not
+            # created until the bodies are decoded, so we use the bound
+            # from the header to ensure new IDs do not collide with them.
+            module.bound = max(module.bound, binary.words[3])
+            lazy_decoder = LazyFunctionDecoder(binary, module.value_to_id)
+            parse_functions(binary, module, lazy_decoder)
+        else:
+            parse_functions(binary, module)
+        module.source_words = binary.words
         return module
     finally:
         del module.value_to_id
+
+
+def read_module(stream, lazy=False):
+    """Create a module from a SPIR-V binary read from stream.
+
+    If lazy is True, the global instructions and the OpFunction and
+    OpFunctionParameter instructions are decoded directly, but the rest
+    of each function is only decoded when its basic_blocks (or anything
+    iterating over them, such as instructions()) is first accessed.
+    Note that the uses of an ID do not include instructions in function
+    bodies that have not been decoded yet, and that errors in a function
+    body are reported when it is decoded."""
+    data = stream.read()
+    if len(data) % 4 != 0:
+        raise ParseError('File length is not divisible by 4')
+    words = array.array('I', data)
+    return parse_module(SpirvBinary(words), lazy)
+
+
+def iter_instructions(stream):
+    """Iterate over the instructions of a SPIR-V binary read from stream.
+
+    This does not create a module -- each instruction is returned as
+    a RawInstruction containing the numeric opcode, the offset of the
+    instruction's first word in the binary, and a memoryview of the
+    instruction's words. It is therefore much cheaper than read_module
+    for scripts that only need to look at opcodes and operands.
+
+    Only the header and the instruction word counts are validated."""
+    data = stream.read()
+    if len(data) % 4 != 0:
+        raise ParseError('File length is not divisible by 4')
+    words = array.array('I', data)
+    binary = SpirvBinary(words)
+    view = memoryview(binary.words)
+    nof_words = len(words)
+    idx = binary.idx
+    while idx < nof_words:
+        word = words[idx]
+        end = idx + (word >> 16)
+        if end == idx:
+            raise ParseError('Incorrect instruction length')
+        if end > nof_words:
+            raise ParseError('Unexpected end of file')
+        yield RawInstruction(word & 0xFFFF, idx, view[idx:end])
+        idx = end
+
+
+def read_module_from_path(path, mmap=True, lazy=False):
+    """Create a module from the SPIR-V binary in the file path.
+
+    If mmap is True, the file is memory-mapped and decoded in place
+    instead of being read into memory (byte-swapped binaries are swapped
+    word by word as they are decoded). The words are copied from the
+    mapping after decoding, unless lazy is True -- the function bodies
+    are then decoded from the mapping, so it is kept open until the
+    module is garbage collected, and the file must not be modified while
+    the module is in use.
+    If mmap is False, this is equivalent to calling read_module with
+    the opened file. See read_module for a description of lazy."""
+    with open(path, 'rb') as stream:
+        if not mmap:
+            return read_module(stream, lazy)
+        stream.seek(0, 2)
+        size = stream.tell()
+        if size % 4 != 0:
+            raise ParseError('File length is not divisible by 4')
+        if size == 0:
+            # Empty files cannot be memory-mapped.
+            raise ParseError('File length shorter than header size')
+        mapped = mmap_module.mmap(stream.fileno(), 0,
+                                  access=mmap_module.ACCESS_READ)
+        if lazy:
+            # The function bodies are decoded from the mapping, so it must
+            # be kept alive. It is closed when the module is garbage
+            # collected.
+            words = memoryview(mapped).cast('I')
+            return parse_module(SpirvBinary(words), lazy)
+        try:
+            view = memoryview(mapped)
+            words = view.cast('I')
+            try:
+                module = parse_module(SpirvBinary(words))
+                # The mapping is closed, so that the file can be
+                # overwritten, and the module needs its own copy of the
+                # words (which is copied directly from the mapping).
+                source_words = array.array('I')
+                source_words.frombytes(view)
+                if isinstance(module.source_words, ByteSwappedWords):
+                    source_words.byteswap()
+                module.source_words = source_words
+                return module
+            finally:
+                words.release()
+                view.release()
+        finally:
+            mapped.close()
+
+
+def _read_result(path):
+    """Read one file, returning a ReadResult instead of raising errors."""
+    # The modules are read eagerly, so they do not keep the files open
+    # (which would exhaust the file descriptors for large sets of files).
+    try:
+        return ReadResult(path, read_module_from_path(path), None)
+    except (ParseError, IOError, OSError) as err:
+        return ReadResult(path, None, err)
+
+
+def read_modules(paths, workers=None):
+    """Create modules from the SPIR-V binaries in the files in paths.
+
+    The files are decoded in parallel by a pool of workers processes
+    (workers defaults to the number of CPUs, and the files are decoded
+    in the calling process if workers is 1).
+
+    Returns a list of ReadResult in the same order as paths. A file that
+    cannot be read or parsed gets its exception as error instead of
+    aborting the other files."""
+    paths = list(paths)
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if workers <= 1 or len(paths) <= 1:
+        return [_read_result(path) for path in paths]
+    pool = multiprocessing.Pool(min(workers, len(paths)))
+    try:
+        chunksize = max(1, len(paths) // (workers * 4))
+        return pool.map(_read_result, paths, chunksize)
+    finally:
+        pool.close()
+        pool.join()
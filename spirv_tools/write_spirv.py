@@ -1,5 +1,7 @@
 """Write module to a stream as a SPIR-V binary."""
 import array
+import functools
+import sys
 
 from spirv_tools import spirv
 from spirv_tools import ir
@@ -13,82 +15,223 @@ def mask_to_value(kind, mask_list):
     return value
 
 
-def format_var_operand(inst_data, kind, operands):
-    """Add a var/optional operand to inst_data.
-
-    A var operand may contain of several operands in the instruction.
-    The provided operands list contains the instruction operands for
-    this operand."""
-    if kind == 'VariableLiteralNumber':
-        for operand in operands:
-            inst_data.append(operand)
-    elif kind == 'VariableId':
-        for operand in operands:
-            inst_data.append(operand.value)
-    elif kind == 'VariableIdLiteralPair':
-        while operands:
-            target_id = operands.pop(0)
-            inst_data.append(target_id.value)
-            inst_data.append(operands.pop(0))
-    elif kind == 'VariableLiteralIdPair':
-        while operands:
-            inst_data.append(operands.pop(0))
-            target_id = operands.pop(0)
-            inst_data.append(target_id.value)
-
-
-def output_instruction(stream, inst):
-    """Output one instruction."""
-    inst_data = [0]
-    op_format = ir.INST_FORMAT[inst.op_name]
-
-    if op_format['type']:
-        inst_data.append(inst.type_id.value)
-    if op_format['result']:
-        inst_data.append(inst.result_id.value)
-
-    kind = None
-    for operand, kind in zip(inst.operands, op_format['operands']):
-        if kind == 'Id' or kind == 'OptionalId':
-            inst_data.append(operand.value)
-        elif kind == 'LiteralNumber' or kind == 'OptionalLiteralNumber':
-            inst_data.append(operand)
-        elif kind in ir.MASKS:
-            inst_data.append(mask_to_value(kind, operand))
-        elif kind[:8] == 'Optional' and kind[-4:] == 'Mask':
-            inst_data.append(mask_to_value(kind[8:], operand))
-        elif kind == 'LiteralString' or kind == 'OptionalLiteralString':
-            for i in range(0, len(operand) + 1, 4):
-                word = 0
-                for char in reversed(operand[i:i+4]):
-                    word = word << 8 | ord(char)
-                inst_data.append(word)
-        elif kind[:8] == 'Variable':
-            # The variable kind must be the last (as rest of the operands
-            # are included in them.
-            operands = inst.operands[(len(op_format['operands'])-1):]
-            format_var_operand(inst_data, kind, operands)
-        elif kind in spirv.spv:
-            constants = spirv.spv[kind]
-            inst_data.append(constants[operand])
-        else:
-            raise Exception('Unhandled kind ' + kind)
+@functools.lru_cache(maxsize=4096)
+def _encode_string(string):
+    """Return the words of a LiteralString.
+
+    The encodings are cached, as the same strings (names, extension names,
+    etc.) tend to be written many times."""
+    data = string.encode('latin-1')
+    data += b'\0' * (4 - len(data) % 4)
+    words = array.array('I', data)
+    if sys.byteorder == 'big':
+        words.byteswap()
+    return words
+
+
+def _encode_id_operand(words, operands, idx):
+    words.append(operands[idx].value)
+    return idx + 1
+
+
+def _encode_literal_number(words, operands, idx):
+    words.append(operands[idx])
+    return idx + 1
+
+
+def _encode_literal_string(words, operands, idx):
+    words.extend(_encode_string(operands[idx]))
+    return idx + 1
+
+
+def _encode_variable_literal_number(words, operands, idx):
+    words.extend(operands[idx:])
+    return len(operands)
+
+
+def _encode_variable_id(words, operands, idx):
+    words.extend([operand.value for operand in operands[idx:]])
+    return len(operands)
+
+
+def _encode_variable_id_literal_pair(words, operands, idx):
+    for i in range(idx, len(operands), 2):
+        words.append(operands[i].value)
+        words.append(operands[i + 1])
+    return len(operands)
+
+
+def _encode_variable_literal_id_pair(words, operands, idx):
+    for i in range(idx, len(operands), 2):
+        words.append(operands[i])
+        words.append(operands[i + 1].value)
+    return len(operands)
+
+
+def _encode_optional_memory_access_mask(words, operands, idx):
+    constants = spirv.spv['MemoryAccessMask']
+    value = 0
+    alignment = None
+    for mask in operands[idx]:
+        if isinstance(mask, tuple):
+            mask, alignment = mask
+        value = value | constants[mask]
+    words.append(value)
+    if alignment is not None:
+        words.append(alignment)
+    return idx + 1
+
+
+def _make_mask_encoder(kind):
+    """Return an encoder for a mask operand of the given kind."""
+    constants = spirv.spv[kind]
+    def encode(words, operands, idx):
+        value = 0
+        for mask in operands[idx]:
+            value = value | constants[mask]
+        words.append(value)
+        return idx + 1
+    return encode
+
+
+def _make_enum_encoder(kind):
+    """Return an encoder for an enumerated constant operand of the kind."""
+    constants = spirv.spv[kind]
+    def encode(words, operands, idx):
+        words.append(constants[operands[idx]])
+        return idx + 1
+    return encode
+
 
-    inst_data[0] = (len(inst_data) << 16) + spirv.spv['Op'][inst.op_name]
-    words = array.array('I', inst_data)
-    words.tofile(stream)
+def _make_unknown_kind_encoder(kind):
+    """Return an encoder reporting that the operand kind is not handled."""
+    def encode(words, operands, idx):
+        raise Exception('Unhandled kind ' + kind)
+    return encode
 
 
-def output_header(stream, module):
-    """Output the SPIR-V header."""
-    header = [ir.MAGIC, ir.VERSION, ir.GENERATOR_MAGIC, module.bound, 0]
-    words = array.array('I', header)
-    words.tofile(stream)
+_OPERAND_ENCODERS = {
+    'Id': _encode_id_operand,
+    'OptionalId': _encode_id_operand,
+    'LiteralNumber': _encode_literal_number,
+    'OptionalLiteralNumber': _encode_literal_number,
+    'LiteralString': _encode_literal_string,
+    'OptionalLiteralString': _encode_literal_string,
+    'VariableLiteralNumber': _encode_variable_literal_number,
+    'VariableId': _encode_variable_id,
+    'VariableIdLiteralPair': _encode_variable_id_literal_pair,
+    'VariableLiteralIdPair': _encode_variable_literal_id_pair,
+    'OptionalMemoryAccessMask': _encode_optional_memory_access_mask,
+}
 
 
-def write_module(stream, module):
-    """Write module to stream as a SPIR-V binary."""
+def _get_operand_encoder(kind):
+    """Return the encoder function for one operand kind."""
+    if kind in _OPERAND_ENCODERS:
+        return _OPERAND_ENCODERS[kind]
+    elif kind[:8] == 'Optional' and kind[-4:] == 'Mask':
+        if kind[8:] in spirv.spv:
+            return _make_mask_encoder(kind[8:])
+    elif kind in ir.MASKS:
+        return _make_mask_encoder(kind)
+    elif kind in spirv.spv:
+        return _make_enum_encoder(kind)
+    return _make_unknown_kind_encoder(kind)
+
+
+def _build_inst_encoders():
+    """Build the table of instruction encoders, indexed by operation name.
+
+    Each entry is a tuple of the opcode, the instruction's type/result
+    flags, and the tuple of encoders for the operands."""
+    encoders = {}
+    for op_name, op_format in ir.INST_FORMAT.items():
+        operand_encoders = tuple(_get_operand_encoder(kind)
+                                 for kind in op_format['operands'])
+        encoders[op_name] = (spirv.spv['Op'][op_name], op_format['type'],
+                             op_format['result'], operand_encoders)
+    return encoders
+
+
+_INST_ENCODERS = _build_inst_encoders()
+
+
+def output_instruction(words, inst):
+    """Append the words of one instruction to the words array."""
+    opcode, has_type, has_result, operand_encoders = (
+        _INST_ENCODERS[inst.op_name])
+    start = len(words)
+    words.append(0)
+    if has_type:
+        words.append(inst.type_id.value)
+    if has_result:
+        words.append(inst.result_id.value)
+
+    operands = inst.operands
+    nof_operands = len(operands)
+    idx = 0
+    for encode in operand_encoders:
+        if idx == nof_operands:
+            break
+        idx = encode(words, operands, idx)
+
+    words[start] = ((len(words) - start) << 16) + opcode
+
+
+def output_header(words, module):
+    """Append the SPIR-V header to the words array."""
+    words.extend([ir.MAGIC, ir.VERSION, ir.GENERATOR_MAGIC, module.bound, 0])
+
+
+def _copy_source_words(words, source_words, source_range):
+    """Append the source_range words of source_words to the words array."""
+    start, end = source_range
+    words.frombytes(memoryview(source_words[start:end]).cast('B'))
+
+
+def encode_module(module, reuse_source=False):
+    """Return the SPIR-V binary for module as an array of words.
+
+    The function bodies that have not been decoded (when the module was
+    read lazily) are copied from the binary the module was read from.
+    If reuse_source is True, the functions and global instruction sections
+    that have not been modified are copied from that binary too, instead
+    of being re-encoded. This is only correct if the instructions have
+    been modified through the API -- changes made directly to an
+    instruction's operands list are not detected."""
     module.renumber_temp_ids()
-    output_header(stream, module)
-    for inst in module.instructions():
-        output_instruction(stream, inst)
+    words = array.array('I')
+    output_header(words, module)
+    source_words = module.source_words
+    global_insts = module.global_instructions
+    for insts_list, source_range in zip(global_insts.sections(),
+                                        global_insts.source_ranges):
+        if (reuse_source and source_words is not None and
+                source_range is not None):
+            _copy_source_words(words, source_words, source_range)
+        else:
+            for inst in insts_list:
+                output_instruction(words, inst)
+    for function in module.functions:
+        source_range = function.source_range
+        if (source_words is not None and source_range is not None and
+                (reuse_source or not function.is_body_decoded())):
+            _copy_source_words(words, source_words, source_range)
+        else:
+            for inst in function.instructions():
+                output_instruction(words, inst)
+    return words
+
+
+def write_module(stream, module, reuse_source=False):
+    """Write module to stream as a SPIR-V binary.
+
+    See encode_module for a description of reuse_source."""
+    stream.write(encode_module(module, reuse_source).tobytes())
+
+
+def write_module_to_bytes(module, reuse_source=False):
+    """Return the SPIR-V binary for module as bytes.
+
+    See encode_module for a description of reuse_source."""
+    return encode_module(module, reuse_source).tobytes()
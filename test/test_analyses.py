@@ -0,0 +1,80 @@
+import io
+import unittest
+
+from spirv_tools import passes
+from spirv_tools import read_il
+from spirv_tools.passes import analyses
+from spirv_tools.passes import instcombine
+from spirv_tools.passes import simplify_cfg
+
+
+# A diamond (%l1 -> %l2/%l3 -> %l4) followed by a loop (%l5 -> %l6 ->
+# %l5), where %l6 exits to %l7, and %l8 is unreachable.
+SOURCE = """
+OpCapability Shader
+OpMemoryModel Logical, GLSL450
+%void = OpTypeVoid
+%bool = OpTypeBool
+%fn = OpTypeFunction %void, %bool
+%true = OpConstantTrue %bool
+%f = OpFunction %void MaskNone, %fn
+%cond = OpFunctionParameter %bool
+%l1 = OpLabel
+OpSelectionMerge %l4, MaskNone
+OpBranchConditional %true, %l2, %l3
+%l2 = OpLabel
+OpBranch %l4
+%l3 = OpLabel
+OpBranch %l4
+%l4 = OpLabel
+OpBranch %l5
+%l5 = OpLabel
+OpLoopMerge %l7, %l6, MaskNone
+OpBranch %l6
+%l6 = OpLabel
+OpBranchConditional %cond, %l5, %l7
+%l7 = OpLabel
+OpReturn
+%l8 = OpLabel
+OpBranch %l7
+OpFunctionEnd
+"""
+
+
+def read_module():
+    return read_il.read_module(io.StringIO(SOURCE))
+
+
+class TestDominators(unittest.TestCase):
+    def test_dominators(self):
+        module = read_module()
+        l1, l2, l3, l4, l5, l6, l7, _ = module.functions[0].basic_blocks
+        idom = analyses.dominators(module.functions[0])
+        self.assertEqual(idom, {
+            l1: None,
+            l2: l1,
+            l3: l1,
+            l4: l1,
+            l5: l4,
+            l6: l5,
+            l7: l6,
+        })
+
+    def test_pass_manager(self):
+        module = read_module()
+        function = module.functions[0]
+        manager = passes.PassManager(module)
+        idom = manager.get_analysis('dominators', function)
+        self.assertIs(manager.get_analysis('dominators', function), idom)
+        # instcombine does not change the CFG, so the result is kept.
+        manager.run_pass(instcombine)
+        self.assertIs(manager.get_analysis('dominators', function), idom)
+        # simplify_cfg removes the unreachable blocks and merges blocks.
+        manager.run_pass(simplify_cfg)
+        new_idom = manager.get_analysis('dominators', function)
+        self.assertIsNot(new_idom, idom)
+        self.assertEqual(new_idom, analyses.dominators(function))
+
+
+if __name__ == '__main__':
+    unittest.main()
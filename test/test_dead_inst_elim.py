@@ -0,0 +1,63 @@
+import io
+import unittest
+
+from spirv_tools import passes
+from spirv_tools import read_il
+from spirv_tools import read_spirv
+from spirv_tools import write_spirv
+from spirv_tools.passes import dead_inst_elim
+
+
+# The constant %c2 is only used by %f2, and the names of the IDs defined
+# in the function bodies must be kept when the bodies are not decoded.
+SOURCE = """
+OpCapability Shader
+OpMemoryModel Logical, GLSL450
+OpEntryPoint Fragment, %main, "main", %out
+OpExecutionMode %main, OriginUpperLeft
+%void = OpTypeVoid
+%int = OpTypeInt 32, 1
+%ptr = OpTypePointer Output, %int
+%out = OpVariable %ptr Output
+%fn = OpTypeFunction %void
+%c1 = OpConstant %int 1
+%c2 = OpConstant %int 2
+%f2 = OpFunction %void MaskNone, %fn
+%l1 = OpLabel
+%a = OpIAdd %int %c2, %c2
+OpStore %out, %a
+OpReturn
+OpFunctionEnd
+%main = OpFunction %void MaskNone, %fn
+%l2 = OpLabel
+%b = OpIMul %int %c1, %c1
+OpStore %out, %c1
+%x = OpFunctionCall %void %f2
+OpReturn
+OpFunctionEnd
+"""
+
+
+def get_binary():
+    module = read_il.read_module(io.StringIO(SOURCE))
+    return write_spirv.write_module_to_bytes(module)
+
+
+def run_pass(binary, lazy, only_main):
+    module = read_spirv.read_module(io.BytesIO(binary), lazy)
+    functions = [module.functions[1]] if only_main else None
+    passes.PassManager(module).run_pass(dead_inst_elim, functions)
+    return write_spirv.write_module_to_bytes(module)
+
+
+class TestDeadInstElim(unittest.TestCase):
+    def test_lazy_same_as_eager(self):
+        binary = get_binary()
+        for only_main in (False, True):
+            expected = run_pass(binary, False, only_main)
+            self.assertNotEqual(expected, binary)
+            self.assertEqual(run_pass(binary, True, only_main), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
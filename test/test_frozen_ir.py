@@ -0,0 +1,149 @@
+import array
+import io
+import unittest
+
+from spirv_tools import frozen_ir
+from spirv_tools import ir
+from spirv_tools import read_il
+from spirv_tools import read_spirv
+from spirv_tools import write_spirv
+
+
+SOURCE = """
+OpCapability Shader
+OpMemoryModel Logical, GLSL450
+OpEntryPoint Fragment, %main, "main", %out
+OpExecutionMode %main, OriginUpperLeft
+OpDecorate %out, Location, 0
+%void = OpTypeVoid
+%bool = OpTypeBool
+%int = OpTypeInt 32, 1
+%ptr = OpTypePointer Output, %int
+%out = OpVariable %ptr Output
+%fn = OpTypeFunction %void
+%fn2 = OpTypeFunction %int, %int
+%c1 = OpConstant %int 1
+%c2 = OpConstant %int 2
+%f1 = OpFunction %int MaskNone, %fn2
+%p = OpFunctionParameter %int
+%l1 = OpLabel
+%a = OpIAdd %int %p, %c1
+OpReturnValue %a
+OpFunctionEnd
+%main = OpFunction %void MaskNone, %fn
+%l2 = OpLabel
+%b = OpFunctionCall %int %f1, %c2
+%cond = OpSLessThan %bool %b, %c2
+OpSelectionMerge %l4, MaskNone
+OpBranchConditional %cond, %l3, %l4
+%l3 = OpLabel
+OpStore %out, %b
+OpBranch %l4
+%l4 = OpLabel
+OpReturn
+OpFunctionEnd
+"""
+
+
+def get_value(operand):
+    """Return operand with the IDs replaced by their values."""
+    if isinstance(operand, (ir.Id, frozen_ir.FrozenId)):
+        return operand.value
+    return operand
+
+
+def get_inst_desc(inst):
+    """Return a description of inst that is the same for ir and frozen_ir."""
+    return (inst.op_name,
+            None if inst.type_id is None else inst.type_id.value,
+            None if inst.result_id is None else inst.result_id.value,
+            [get_value(operand) for operand in inst.operands])
+
+
+class TestFrozenModule(unittest.TestCase):
+    def setUp(self):
+        module = read_il.read_module(io.StringIO(SOURCE))
+        binary = write_spirv.write_module_to_bytes(module)
+        self.module = read_spirv.read_module(io.BytesIO(binary))
+        self.frozen_module = frozen_ir.FrozenModule.from_module(self.module)
+        self.binary = binary
+
+    def test_instructions(self):
+        expected = [get_inst_desc(inst)
+                    for inst in self.module.instructions()]
+        frozen_module = self.frozen_module
+        self.assertEqual(len(frozen_module), len(expected))
+        self.assertEqual([get_inst_desc(inst)
+                          for inst in frozen_module.instructions()],
+                         expected)
+        self.assertEqual([get_inst_desc(inst)
+                          for inst in frozen_module.instructions_reversed()],
+                         expected[::-1])
+        self.assertEqual([get_inst_desc(inst) for inst in
+                          frozen_module.global_instructions.instructions()],
+                         [get_inst_desc(inst) for inst in
+                          self.module.global_instructions.instructions()])
+
+    def test_functions(self):
+        functions = list(self.module.functions)
+        frozen_functions = self.frozen_module.functions
+        self.assertEqual(len(frozen_functions), len(functions))
+        for function, frozen_function in zip(functions, frozen_functions):
+            self.assertEqual(get_inst_desc(frozen_function.inst),
+                             get_inst_desc(function.inst))
+            self.assertEqual(
+                [get_inst_desc(inst) for inst in frozen_function.parameters],
+                [get_inst_desc(inst) for inst in function.parameters])
+            self.assertEqual(
+                [get_inst_desc(inst) for inst in
+                 frozen_function.instructions()],
+                [get_inst_desc(inst) for inst in function.instructions()])
+            basic_blocks = list(function.basic_blocks)
+            frozen_basic_blocks = list(frozen_function.basic_blocks)
+            self.assertEqual(len(frozen_basic_blocks), len(basic_blocks))
+            for basic_block, frozen_basic_block in zip(basic_blocks,
+                                                       frozen_basic_blocks):
+                self.assertEqual(get_inst_desc(frozen_basic_block.inst),
+                                 get_inst_desc(basic_block.inst))
+                self.assertEqual(
+                    [get_inst_desc(inst) for inst in frozen_basic_block.insts],
+                    [get_inst_desc(inst) for inst in basic_block.insts])
+                for frozen_inst in frozen_basic_block.insts:
+                    self.assertEqual(frozen_inst.basic_block,
+                                     frozen_basic_block)
+                    self.assertEqual(frozen_inst.function, frozen_function)
+
+    def test_ids(self):
+        for inst in self.module.instructions():
+            if inst.result_id is None:
+                continue
+            value = inst.result_id.value
+            frozen_inst = self.frozen_module.get_inst_by_id(value)
+            self.assertEqual(get_inst_desc(frozen_inst), get_inst_desc(inst))
+            self.assertEqual(
+                sorted(get_inst_desc(user) for user in
+                       self.frozen_module.users(value)),
+                sorted(get_inst_desc(user) for user in
+                       inst.result_id.uses))
+        self.assertIsNone(self.frozen_module.get_inst_by_id(
+            self.module.bound))
+
+    def test_opcode_histogram(self):
+        self.assertEqual(
+            self.frozen_module.opcode_histogram(),
+            dict((op_name, len(self.frozen_module.find_instructions(op_name)))
+                 for op_name in set(inst.op_name for inst in
+                                    self.module.instructions())))
+
+    def test_byte_swapped(self):
+        words = array.array('I', self.binary)
+        words.byteswap()
+        frozen_module = frozen_ir.FrozenModule(memoryview(words))
+        self.assertEqual([get_inst_desc(inst)
+                          for inst in frozen_module.instructions()],
+                         [get_inst_desc(inst)
+                          for inst in self.module.instructions()])
+
+
+if __name__ == '__main__':
+    unittest.main()
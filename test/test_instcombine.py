@@ -0,0 +1,48 @@
+import io
+import unittest
+
+from spirv_tools import read_il
+from spirv_tools.passes import instcombine
+
+
+# The (not p) and (not p) is changed to not (p or p), where the new
+# (p or p) can be simplified further to p.
+SOURCE = """
+OpCapability Shader
+OpMemoryModel Logical, GLSL450
+OpEntryPoint Fragment, %main, "main"
+OpExecutionMode %main, OriginUpperLeft
+%void = OpTypeVoid
+%bool = OpTypeBool
+%fn = OpTypeFunction %void
+%fnb = OpTypeFunction %bool, %bool
+%f = OpFunction %bool MaskNone, %fnb
+%p = OpFunctionParameter %bool
+%l1 = OpLabel
+%n1 = OpLogicalNot %bool %p
+%n2 = OpLogicalNot %bool %p
+%r = OpLogicalAnd %bool %n1, %n2
+OpReturnValue %r
+OpFunctionEnd
+%main = OpFunction %void MaskNone, %fn
+%l2 = OpLabel
+OpReturn
+OpFunctionEnd
+"""
+
+
+class TestInstcombine(unittest.TestCase):
+    def test_fixed_point(self):
+        module = read_il.read_module(io.StringIO(SOURCE))
+        self.assertTrue(instcombine.run(module).changed)
+        self.assertFalse(instcombine.run(module).changed)
+
+        function = module.functions[0]
+        return_inst = function.basic_blocks[0].insts[-1]
+        not_inst = return_inst.operands[0].inst
+        self.assertEqual(not_inst.op_name, 'OpLogicalNot')
+        self.assertIs(not_inst.operands[0], function.parameters[0].result_id)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,232 @@
+import io
+import pickle
+import unittest
+
+from spirv_tools import ir
+from spirv_tools import read_il
+from spirv_tools import read_spirv
+from spirv_tools import write_il
+from spirv_tools import write_spirv
+
+
+SOURCE = """
+OpCapability Shader
+OpMemoryModel Logical, GLSL450
+OpEntryPoint Fragment, %main, "main", %out
+OpExecutionMode %main, OriginUpperLeft
+%void = OpTypeVoid
+%int = OpTypeInt 32, 1
+%ptr = OpTypePointer Output, %int
+%out = OpVariable %ptr Output
+%fn = OpTypeFunction %void
+%c1 = OpConstant %int 1
+%c2 = OpConstant %int 2
+%main = OpFunction %void MaskNone, %fn
+%l1 = OpLabel
+%a = OpIAdd %int %c1, %c2
+%b = OpIMul %int %a, %a
+%c = OpISub %int %a, %c2
+OpStore %out, %b
+OpReturn
+OpFunctionEnd
+"""
+
+
+def read_module():
+    module = read_il.read_module(io.StringIO(SOURCE))
+    binary = write_spirv.write_module_to_bytes(module)
+    return read_spirv.read_module(io.BytesIO(binary))
+
+
+def get_id(module, name):
+    """Return the ID named name by an OpName instruction."""
+    for inst in module.global_instructions.name_insts:
+        if inst.operands[1] == name:
+            return inst.operands[0]
+    return None
+
+
+def get_insts(module):
+    """Return a dictionary mapping op_name to the instruction in main."""
+    return dict((inst.op_name, inst)
+                for inst in module.functions[0].basic_blocks[0].insts)
+
+
+def get_il(module):
+    stream = io.StringIO()
+    write_il.write_module(stream, module)
+    return stream.getvalue()
+
+
+class TestIdUses(unittest.TestCase):
+    def test_uses(self):
+        module = read_module()
+        insts = get_insts(module)
+        a_id = insts['OpIAdd'].result_id
+        # read_il creates an OpName for each named ID.
+        name_insts = [inst for inst in module.global_instructions.name_insts
+                      if inst.operands[0] is a_id]
+        self.assertEqual(len(name_insts), 1)
+        name_inst = name_insts[0]
+        uses = a_id.uses
+        self.assertIsInstance(uses, frozenset)
+        self.assertEqual(uses, frozenset([insts['OpIMul'], insts['OpISub'],
+                                          name_inst]))
+        self.assertEqual(a_id.nof_uses(), 3)
+        self.assertTrue(a_id.has_uses())
+
+        # The set is a snapshot.
+        insts['OpISub'].destroy()
+        self.assertIn(insts['OpISub'], uses)
+        self.assertEqual(a_id.uses, frozenset([insts['OpIMul'], name_inst]))
+        self.assertEqual(a_id.nof_uses(), 2)
+
+        b_id = insts['OpIMul'].result_id
+        self.assertEqual(b_id.nof_uses(), 2)
+        insts['OpStore'].destroy()
+        self.assertEqual(b_id.nof_uses(), 1)
+        self.assertTrue(b_id.has_uses())
+        for inst in b_id.uses:
+            inst.destroy()
+        self.assertFalse(b_id.has_uses())
+        self.assertEqual(b_id.nof_uses(), 0)
+        self.assertEqual(b_id.uses, frozenset())
+
+    def test_new_id(self):
+        module = read_module()
+        id_obj = ir.Id(module)
+        self.assertTrue(id_obj.is_temp)
+        self.assertFalse(id_obj.has_uses())
+
+
+class TestModuleCopies(unittest.TestCase):
+    def test_copies_same_as_original(self):
+        binary = write_spirv.write_module_to_bytes(read_module())
+        for lazy in (False, True):
+            module = read_spirv.read_module(io.BytesIO(binary), lazy)
+            copies = [
+                ir.Module.from_snapshot(module.to_snapshot()),
+                pickle.loads(pickle.dumps(module)),
+                module.clone(),
+                module.clone(copy_on_write=True),
+            ]
+            for copy in copies:
+                self.assertEqual(write_spirv.write_module_to_bytes(copy),
+                                 binary)
+
+    def test_clone_is_independent(self):
+        binary = write_spirv.write_module_to_bytes(read_module())
+        for copy_on_write in (False, True):
+            module = read_spirv.read_module(io.BytesIO(binary), True)
+            copy = module.clone(copy_on_write)
+            get_insts(copy)['OpISub'].destroy()
+            self.assertEqual(write_spirv.write_module_to_bytes(module),
+                             binary)
+            self.assertNotEqual(write_spirv.write_module_to_bytes(copy),
+                                binary)
+
+
+class TestGetGlobalInst(unittest.TestCase):
+    def test_existing_inst(self):
+        module = read_module()
+        c1_inst = get_id(module, 'c1').inst
+        int_id = c1_inst.type_id
+        self.assertIs(module.get_global_inst('OpConstant', int_id, [1]),
+                      c1_inst)
+        self.assertIs(module.get_constant(int_id, 1), c1_inst)
+
+    def test_new_inst(self):
+        module = read_module()
+        int_id = get_id(module, 'int')
+        nof_constants = len(module.global_instructions.type_insts)
+        c3_inst = module.get_global_inst('OpConstant', int_id, [3])
+        self.assertEqual(len(module.global_instructions.type_insts),
+                         nof_constants + 1)
+        self.assertIs(module.get_global_inst('OpConstant', int_id, [3]),
+                      c3_inst)
+        self.assertEqual(len(module.global_instructions.type_insts),
+                         nof_constants + 1)
+
+    def test_modified_inst(self):
+        module = read_module()
+        int_inst = get_id(module, 'int').inst
+        ptr_inst = get_id(module, 'ptr').inst
+        uint_inst = module.get_global_inst('OpTypeInt', None, [32, 0])
+        int_inst.replace_uses_with(uint_inst)
+        self.assertIs(module.get_global_inst(
+            'OpTypePointer', None, ['Output', uint_inst.result_id]), ptr_inst)
+        new_inst = module.get_global_inst(
+            'OpTypePointer', None, ['Output', int_inst.result_id])
+        self.assertIsNot(new_inst, ptr_inst)
+
+
+class TestStructuralKey(unittest.TestCase):
+    def test_commutative(self):
+        module = read_module()
+        insts = get_insts(module)
+        c1_id = get_id(module, 'c1')
+        c2_id = get_id(module, 'c2')
+        int_id = get_id(module, 'int')
+        add_inst = ir.Instruction(module, 'OpIAdd', int_id, [c2_id, c1_id])
+        self.assertEqual(add_inst.structural_key(),
+                         insts['OpIAdd'].structural_key())
+        sub_inst = ir.Instruction(module, 'OpISub', int_id,
+                                  [c2_id, insts['OpIAdd'].result_id])
+        self.assertNotEqual(sub_inst.structural_key(),
+                            insts['OpISub'].structural_key())
+
+    def test_invalidated_when_modified(self):
+        module = read_module()
+        insts = get_insts(module)
+        c1_inst = get_id(module, 'c1').inst
+        c2_id = get_id(module, 'c2')
+        int_id = get_id(module, 'int')
+        key = insts['OpISub'].structural_key()
+        self.assertIs(insts['OpISub'].structural_key(), key)
+        insts['OpIAdd'].replace_uses_with(c1_inst)
+        sub_inst = ir.Instruction(module, 'OpISub', int_id,
+                                  [c1_inst.result_id, c2_id])
+        self.assertNotEqual(insts['OpISub'].structural_key(), key)
+        self.assertEqual(insts['OpISub'].structural_key(),
+                         sub_inst.structural_key())
+
+
+class TestRenumberIds(unittest.TestCase):
+    def test_renumber_temp_ids(self):
+        module = read_module()
+        insts = get_insts(module)
+        bound = module.bound
+        new_inst = ir.Instruction(module, 'OpIAdd', insts['OpIAdd'].type_id,
+                                  [insts['OpIAdd'].result_id,
+                                   insts['OpIAdd'].result_id])
+        new_inst.insert_after(insts['OpIAdd'])
+        self.assertTrue(new_inst.result_id.is_temp)
+        module.renumber_temp_ids()
+        self.assertFalse(new_inst.result_id.is_temp)
+        self.assertEqual(new_inst.result_id.value, bound)
+        self.assertEqual(module.bound, bound + 1)
+
+        binary = write_spirv.write_module_to_bytes(module)
+        new_module = read_spirv.read_module(io.BytesIO(binary))
+        self.assertEqual(get_il(new_module), get_il(module))
+
+    def test_compact_ids(self):
+        module = read_module()
+        insts = get_insts(module)
+        insts['OpISub'].destroy()
+        il = get_il(module)
+        module.compact_ids()
+        values = sorted(inst.result_id.value
+                        for inst in module.instructions()
+                        if inst.result_id is not None)
+        self.assertEqual(values, list(range(1, len(values) + 1)))
+        self.assertEqual(module.bound, len(values) + 1)
+        self.assertEqual(get_il(module), il)
+
+        binary = write_spirv.write_module_to_bytes(module)
+        new_module = read_spirv.read_module(io.BytesIO(binary))
+        self.assertEqual(get_il(new_module), il)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import io
+import unittest
+
+from spirv_tools import passes
+from spirv_tools import read_il
+from spirv_tools import read_spirv
+from spirv_tools import write_spirv
+
+
+# The constants %c1 and %c2 are only used by functions that are not
+# changed by the passes.
+SOURCE = """
+OpCapability Shader
+OpMemoryModel Logical, GLSL450
+OpEntryPoint Fragment, %main, "main", %out
+OpExecutionMode %main, OriginUpperLeft
+%void = OpTypeVoid
+%int = OpTypeInt 32, 1
+%ptr = OpTypePointer Output, %int
+%out = OpVariable %ptr Output
+%fn = OpTypeFunction %void
+%c1 = OpConstant %int 1
+%c2 = OpConstant %int 2
+%c3 = OpConstant %int 3
+%c0 = OpConstant %int 0
+%f1 = OpFunction %void MaskNone, %fn
+%l1 = OpLabel
+OpStore %out, %c1
+OpReturn
+OpFunctionEnd
+%f2 = OpFunction %void MaskNone, %fn
+%l2 = OpLabel
+OpStore %out, %c2
+OpReturn
+OpFunctionEnd
+%main = OpFunction %void MaskNone, %fn
+%l3 = OpLabel
+%a = OpIAdd %int %c3, %c0
+OpStore %out, %a
+%x = OpFunctionCall %void %f1
+%y = OpFunctionCall %void %f2
+OpReturn
+OpFunctionEnd
+"""
+
+
+def get_binary():
+    module = read_il.read_module(io.StringIO(SOURCE))
+    stream = io.BytesIO()
+    write_spirv.write_module(stream, module)
+    return stream.getvalue()
+
+
+def optimize_binary(binary, processes, lazy):
+    module = read_spirv.read_module(io.BytesIO(binary), lazy)
+    passes.optimize(module, processes)
+    stream = io.BytesIO()
+    write_spirv.write_module(stream, module)
+    return stream.getvalue()
+
+
+class TestParallel(unittest.TestCase):
+    def test_same_as_serial(self):
+        binary = get_binary()
+        expected = optimize_binary(binary, 1, False)
+        for lazy in (False, True):
+            self.assertEqual(optimize_binary(binary, 2, lazy), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import io
+import types
+import unittest
+
+from spirv_tools import passes
+from spirv_tools import read_il
+from spirv_tools.passes import pass_manager
+
+
+SOURCE = """
+OpCapability Shader
+OpMemoryModel Logical, GLSL450
+OpEntryPoint Fragment, %main, "main", %out
+OpExecutionMode %main, OriginUpperLeft
+%void = OpTypeVoid
+%int = OpTypeInt 32, 1
+%ptr = OpTypePointer Output, %int
+%out = OpVariable %ptr Output
+%fn = OpTypeFunction %void
+%c1 = OpConstant %int 1
+%c2 = OpConstant %int 2
+%f1 = OpFunction %void MaskNone, %fn
+%l1 = OpLabel
+OpStore %out, %c1
+OpReturn
+OpFunctionEnd
+%main = OpFunction %void MaskNone, %fn
+%l2 = OpLabel
+%a = OpIAdd %int %c1, %c2
+OpStore %out, %a
+%x = OpFunctionCall %void %f1
+OpReturn
+OpFunctionEnd
+"""
+
+
+def read_module():
+    return read_il.read_module(io.StringIO(SOURCE))
+
+
+def make_pass(name, results, module_pass=False):
+    """Return a pass module that records the functions it is run on.
+
+    The pass returns the PassResults in results (one for each run, and
+    UNCHANGED when results is exhausted)."""
+    pass_module = types.ModuleType(name)
+    pass_module.calls = []
+    if module_pass:
+        pass_module.MODULE_PASS = True
+
+    def run(module, manager=None, functions=None):
+        pass_module.calls.append(functions)
+        if len(pass_module.calls) <= len(results):
+            return results[len(pass_module.calls) - 1]
+        return pass_manager.UNCHANGED
+    pass_module.run = run
+    return pass_module
+
+
+class TestRunToFixedPoint(unittest.TestCase):
+    def test_dirty_functions(self):
+        module = read_module()
+        f1, main = list(module.functions)
+        change_f1 = make_pass('change_f1',
+                              [pass_manager.make_result(False, [f1])])
+        record = make_pass('record', [])
+        change_module = make_pass('change_module',
+                                  [pass_manager.make_result(True, [])],
+                                  module_pass=True)
+        manager = passes.PassManager(module)
+        counts = manager.run_to_fixed_point(
+            [change_f1, record, change_module])
+        self.assertEqual(counts, {change_f1: 2, record: 1, change_module: 2})
+        self.assertEqual(change_f1.calls, [set([f1, main]), set([f1])])
+        self.assertEqual(record.calls, [set([f1, main])])
+        self.assertEqual(change_module.calls, [set([f1, main]), set()])
+
+    def test_max_iterations(self):
+        module = read_module()
+        f1 = module.functions[0]
+        result = pass_manager.make_result(False, [f1])
+        change_f1 = make_pass('change_f1', [result] * 10)
+        manager = passes.PassManager(module)
+        counts = manager.run_to_fixed_point([change_f1], max_iterations=3)
+        self.assertEqual(counts, {change_f1: 3})
+
+    def test_optimize(self):
+        module = read_module()
+        counts = passes.optimize(module)
+        self.assertEqual(set(counts), set(passes.OPTIMIZE_PIPELINE))
+        self.assertTrue(all(count >= 1 for count in counts.values()))
+        # The module is at a fixed point, so no pass changes it when
+        # the pipeline is run again.
+        manager = passes.PassManager(module)
+        for pass_module in passes.get_pipeline(passes.OPTIMIZE_PIPELINE):
+            self.assertFalse(manager.run_pass(pass_module).changed)
+
+
+if __name__ == '__main__':
+    unittest.main()
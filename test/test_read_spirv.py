@@ -0,0 +1,134 @@
+import array
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from spirv_tools import ir
+from spirv_tools import read_il
+from spirv_tools import read_spirv
+from spirv_tools import write_spirv
+
+
+SOURCE = """
+OpCapability Shader
+OpMemoryModel Logical, GLSL450
+OpEntryPoint Fragment, %main, "main", %out
+OpExecutionMode %main, OriginUpperLeft
+OpName %out, "out"
+%void = OpTypeVoid
+%int = OpTypeInt 32, 1
+%ptr = OpTypePointer Output, %int
+%out = OpVariable %ptr Output
+%fn = OpTypeFunction %void
+%c1 = OpConstant %int 1
+%c2 = OpConstant %int 2
+%f1 = OpFunction %void MaskNone, %fn
+%l1 = OpLabel
+OpStore %out, %c1
+OpReturn
+OpFunctionEnd
+%main = OpFunction %void MaskNone, %fn
+%l2 = OpLabel
+%a = OpIAdd %int %c1, %c2
+OpStore %out, %a
+%x = OpFunctionCall %void %f1
+OpReturn
+OpFunctionEnd
+"""
+
+
+def get_binary():
+    module = read_il.read_module(io.StringIO(SOURCE))
+    return write_spirv.write_module_to_bytes(module)
+
+
+def byte_swap(binary):
+    words = array.array('I', binary)
+    words.byteswap()
+    return words.tobytes()
+
+
+class TestReadModule(unittest.TestCase):
+    def test_round_trip(self):
+        binary = get_binary()
+        for data in (binary, byte_swap(binary)):
+            for lazy in (False, True):
+                module = read_spirv.read_module(io.BytesIO(data), lazy)
+                self.assertEqual(write_spirv.write_module_to_bytes(module),
+                                 binary)
+
+    def test_iter_instructions(self):
+        binary = get_binary()
+        module = read_spirv.read_module(io.BytesIO(binary))
+        for data in (binary, byte_swap(binary)):
+            raw_insts = list(read_spirv.iter_instructions(io.BytesIO(data)))
+            self.assertEqual(
+                [ir.OPCODE_TO_OPNAME[raw_inst.opcode]
+                 for raw_inst in raw_insts],
+                [inst.op_name for inst in module.instructions()])
+            self.assertEqual(
+                b''.join(raw_inst.words.tobytes() for raw_inst in raw_insts),
+                binary[20:])
+
+
+class TestReadModuleFromPath(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'test.spv')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_file(self, data):
+        with open(self.path, 'wb') as stream:
+            stream.write(data)
+
+    def test_overwrite_file(self):
+        binary = get_binary()
+        for data in (binary, byte_swap(binary)):
+            self.write_file(data)
+            module = read_spirv.read_module_from_path(self.path)
+            with open(self.path, 'wb') as stream:
+                write_spirv.write_module(stream, module, reuse_source=True)
+            with open(self.path, 'rb') as stream:
+                self.assertEqual(stream.read(), binary)
+
+    def test_mmap_same_as_stream(self):
+        binary = get_binary()
+        for data in (binary, byte_swap(binary)):
+            self.write_file(data)
+            for mmap in (False, True):
+                for lazy in (False, True):
+                    module = read_spirv.read_module_from_path(
+                        self.path, mmap=mmap, lazy=lazy)
+                    for reuse_source in (False, True):
+                        self.assertEqual(write_spirv.write_module_to_bytes(
+                            module, reuse_source), binary)
+                    del module
+
+    @unittest.skipIf(resource is None, 'resource module not available')
+    def test_read_modules_file_descriptors(self):
+        # The modules must not keep the files open, so reading more files
+        # than the file descriptor limit must work.
+        self.write_file(get_binary())
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        limit = 64 if soft == resource.RLIM_INFINITY else min(soft, 64)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (limit, hard))
+        try:
+            results = read_spirv.read_modules([self.path] * (limit * 2),
+                                              workers=1)
+        finally:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+        self.assertEqual([result.error for result in results],
+                         [None] * (limit * 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import io
+import unittest
+
+from spirv_tools import passes
+from spirv_tools import read_il
+from spirv_tools import read_spirv
+from spirv_tools import write_spirv
+from spirv_tools.passes import dead_inst_elim
+from spirv_tools.passes import statistics
+
+
+SOURCE = """
+OpCapability Shader
+OpMemoryModel Logical, GLSL450
+OpEntryPoint Fragment, %main, "main", %out
+OpExecutionMode %main, OriginUpperLeft
+%void = OpTypeVoid
+%int = OpTypeInt 32, 1
+%ptr = OpTypePointer Output, %int
+%out = OpVariable %ptr Output
+%fn = OpTypeFunction %void
+%c1 = OpConstant %int 1
+%c2 = OpConstant %int 2
+%f1 = OpFunction %void MaskNone, %fn
+%l1 = OpLabel
+%b = OpIMul %int %c1, %c2
+OpStore %out, %c1
+OpReturn
+OpFunctionEnd
+%main = OpFunction %void MaskNone, %fn
+%l2 = OpLabel
+%a = OpIAdd %int %c1, %c2
+OpStore %out, %a
+%x = OpFunctionCall %void %f1
+OpReturn
+OpFunctionEnd
+"""
+
+
+def get_binary():
+    module = read_il.read_module(io.StringIO(SOURCE))
+    return write_spirv.write_module_to_bytes(module)
+
+
+def get_stats(binary, processes, lazy):
+    module = read_spirv.read_module(io.BytesIO(binary), lazy)
+    stats = passes.PassStatistics()
+    passes.optimize(module, processes, stats)
+    return module, stats
+
+
+class TestPassStatistics(unittest.TestCase):
+    def test_counts(self):
+        binary = get_binary()
+        module = read_spirv.read_module(io.BytesIO(binary), True)
+        nof_insts = statistics.count_instructions(module)
+        self.assertEqual(nof_insts, len(list(read_spirv.iter_instructions(
+            io.BytesIO(binary)))))
+        # Counting the instructions does not decode the function bodies.
+        self.assertFalse(any(function.is_body_decoded()
+                             for function in module.functions))
+
+        stats = passes.PassStatistics()
+        manager = passes.PassManager(module, statistics=stats)
+        manager.run_pass(dead_inst_elim)
+        record, = stats.records
+        self.assertEqual(record.name, 'dead_inst_elim')
+        self.assertEqual(record.runs, 1)
+        self.assertEqual(record.insts_before, nof_insts)
+        # The OpIMul and its OpName are removed.
+        self.assertEqual(record.insts_destroyed, 2)
+        self.assertEqual(record.insts_created, 0)
+        self.assertEqual(record.insts_after, nof_insts - 2)
+        self.assertEqual(stats.insts_destroyed, 2)
+
+    def test_sizes_consistent(self):
+        binary = get_binary()
+        for lazy in (False, True):
+            module, stats = get_stats(binary, 1, lazy)
+            self.assertEqual(stats.records[-1].insts_after,
+                             statistics.count_instructions(module))
+            for record in stats.records:
+                self.assertEqual(record.insts_before - record.insts_after,
+                                 record.insts_destroyed -
+                                 record.insts_created)
+            report = stats.report()
+            self.assertEqual([stats.name for stats in report],
+                             passes.OPTIMIZE_PIPELINE)
+            self.assertEqual(sum(stats.runs for stats in report),
+                             len(stats.records))
+
+    def test_same_as_serial(self):
+        binary = get_binary()
+
+        def get_counts(stats):
+            return [record[:2] + record[3:] for record in stats.records]
+        _, expected = get_stats(binary, 1, False)
+        for lazy in (False, True):
+            _, stats = get_stats(binary, 2, lazy)
+            self.assertEqual(get_counts(stats), get_counts(expected))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import io
+import unittest
+
+from spirv_tools import read_il
+from spirv_tools import read_spirv
+from spirv_tools import write_spirv
+
+
+SOURCE = """
+OpCapability Shader
+OpMemoryModel Logical, GLSL450
+OpEntryPoint Fragment, %main, "main", %out
+OpExecutionMode %main, OriginUpperLeft
+OpDecorate %out, Location, 0
+%void = OpTypeVoid
+%int = OpTypeInt 32, 1
+%ptr = OpTypePointer Output, %int
+%out = OpVariable %ptr Output
+%fn = OpTypeFunction %void
+%c1 = OpConstant %int 1
+%c2 = OpConstant %int 2
+%main = OpFunction %void MaskNone, %fn
+%l1 = OpLabel
+%a = OpIAdd %int %c1, %c2
+OpStore %out, %a
+OpReturn
+OpFunctionEnd
+"""
+
+
+def get_binary():
+    module = read_il.read_module(io.StringIO(SOURCE))
+    return write_spirv.write_module_to_bytes(module)
+
+
+def find_inst(module, op_name):
+    for inst in module.instructions():
+        if inst.op_name == op_name:
+            return inst
+    return None
+
+
+class TestWriteSpirv(unittest.TestCase):
+    def test_unmodified(self):
+        binary = get_binary()
+        for lazy in (False, True):
+            for reuse_source in (False, True):
+                module = read_spirv.read_module(io.BytesIO(binary), lazy)
+                self.assertEqual(
+                    write_spirv.write_module_to_bytes(module, reuse_source),
+                    binary)
+
+    def test_operands_modified_in_place(self):
+        binary = get_binary()
+        module = read_spirv.read_module(io.BytesIO(binary))
+        add_inst = find_inst(module, 'OpIAdd')
+        add_inst.operands.reverse()
+        decorate_inst = find_inst(module, 'OpDecorate')
+        decorate_inst.operands[2] = 7
+        new_binary = write_spirv.write_module_to_bytes(module)
+        self.assertNotEqual(new_binary, binary)
+
+        new_module = read_spirv.read_module(io.BytesIO(new_binary))
+        add_inst = find_inst(new_module, 'OpIAdd')
+        self.assertEqual([operand.inst.value for operand in add_inst.operands],
+                         [2, 1])
+        self.assertEqual(find_inst(new_module, 'OpDecorate').operands[2], 7)
+
+
+if __name__ == '__main__':
+    unittest.main()